@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import dash_views
+import sales_cube
+import sales_data
+
+# the tract table behind the map (median price / SF, price & vintage and the
+# sale count per GEOID) for every sale-year range x vintage range x region,
+# as one long table:
+#
+#   python batch_export.py tract_tables.parquet [--county Forsyth] [--workers 4]
+#
+# each county's sales are read once into a cube over all its years; every
+# combination is then a roll-up of that cube's cells, spread over a process
+# pool by sale-year range. regions are the entire county and each
+# sub-geography on its own. .csv outputs are written as csv, anything else
+# as parquet
+
+EXPORT_COLUMNS = {
+    'price_sf': 'median_price_sf',
+    'Sale Price': 'median_sale_price',
+    'year_blt': 'median_year_blt',
+    'count': 'sales',
+}
+
+# the cube of the county being exported. set before the pool forks, so
+# workers share it instead of each reading the sales again
+_cube = None
+
+
+def load_cube(county, engine='exact'):
+    global _cube
+    if _cube is None or _cube[0] != (county, engine):
+        store = sales_data.SalesStore()
+        _cube = ((county, engine), sales_cube.SalesCube(store.select([county]), engine=engine))
+    return _cube[1]
+
+
+def combinations(store, county):
+    # (years, year_built, region) of every export, region None for the county
+    regions = [None] + sales_data.sub_geos(county)
+    return [(years, year_built, region)
+            for years in dash_views.slider_ranges(store.years(county))
+            for year_built in dash_views.slider_ranges(dash_views.YEAR_BUILT_OPTIONS)
+            for region in regions]
+
+
+def tract_tables(county, combos, engine='exact'):
+    # the tract tables of some combinations, stacked with their keys. a
+    # tract's medians don't depend on the region, which only picks tracts, so
+    # each (years, vintage) is queried once and sliced per region
+    cube = load_cube(county, engine)
+    region_geoids = {region: cube.geoids_in([region]) for region in sales_data.sub_geos(county)}
+    frames, tables = [], {}
+    for years, year_built, region in combos:
+        if (years, year_built) not in tables:
+            tables[years, year_built] = cube.tract_table(years, year_built)
+        table = tables[years, year_built]
+        if region is not None:
+            table = table[table['GEOID'].isin(region_geoids[region])]
+        frames.append(table.rename(columns=EXPORT_COLUMNS).assign(
+            county=county, year_from=years[0], year_to=years[1],
+            built_from=year_built[0], built_to=year_built[1],
+            region=region if region is not None else 'Entire county'))
+    return pd.concat(frames, ignore_index=True)
+
+
+def export(out_path, counties=None, workers=os.cpu_count(), engine='exact'):
+    store = sales_data.SalesStore()
+    frames = []
+    for county in counties or store.counties:
+        load_cube(county, engine)
+        combos = combinations(store, county)
+        # one task per sale-year range
+        tasks = {}
+        for combo in combos:
+            tasks.setdefault(combo[0], []).append(combo)
+        with ProcessPoolExecutor(workers) as pool:
+            frames += pool.map(tract_tables, [county] * len(tasks), tasks.values(),
+                               [engine] * len(tasks))
+
+    df = pd.concat(frames, ignore_index=True)
+    keys = ['county', 'year_from', 'year_to', 'built_from', 'built_to', 'region']
+    df = df[keys + ['GEOID'] + list(EXPORT_COLUMNS.values())]
+    if out_path.endswith('.csv'):
+        df.to_csv(out_path, index=False)
+    else:
+        df.to_parquet(out_path, index=False)
+    return df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Export the tract table of every filter combination.')
+    parser.add_argument('out', help='.parquet or .csv file to write')
+    parser.add_argument('--county', nargs='+', help='counties to export, all by default')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--engine', choices=sales_cube.ENGINES, default='exact')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = export(args.out, args.county, args.workers, args.engine)
+    n = len(df.groupby(['county', 'year_from', 'year_to', 'built_from', 'built_to', 'region']))
+    print(f'{n:,} combinations, {len(df):,} tract rows written to {args.out} '
+          f'in {time.perf_counter() - start:.1f}s')
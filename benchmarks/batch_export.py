@@ -0,0 +1,66 @@
+# throughput of exporting the tract table of every filter combination:
+# batch_export.py (one cube over all the county's years, rolled up per
+# combination over a process pool) vs. calling the dashboard's filter_data()
+# path once per combination, cold (a cube built from the selected years every
+# call) and with its cube reused per sale-year range as st.cache_resource would
+#
+#   python -m benchmarks.batch_export [--workers 1 4]
+
+import argparse
+import os
+import tempfile
+import time
+
+import batch_export
+import dash_views
+import sales_cube
+import sales_data
+
+COUNTY = 'Forsyth'
+
+
+def filter_data(store, years, year_built, region, cube=None):
+    # the dashboard's filter_data() without streamlit's caches
+    geography, sub_geo = ('Entire county', '') if region is None \
+        else ('Sub-geography', [region])
+    if cube is None:
+        cube = sales_cube.SalesCube(store.select([COUNTY], years))
+    return dash_views.filter_cube(cube, years, year_built, geography, sub_geo)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count()])
+    args = parser.parse_args()
+
+    store = sales_data.SalesStore()
+    combos = batch_export.combinations(store, COUNTY)
+    print(f'{len(combos):,} combinations\n')
+    print(f"{'path':>28} {'s':>7} {'combos/s':>9}")
+
+    def report(name, seconds):
+        print(f'{name:>28} {seconds:>7.2f} {len(combos) / seconds:>9.0f}')
+
+    start = time.perf_counter()
+    for years, year_built, region in combos:
+        filter_data(store, years, year_built, region)
+    report('filter_data, cold', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    cubes = {}
+    for years, year_built, region in combos:
+        if years not in cubes:
+            cubes[years] = sales_cube.SalesCube(store.select([COUNTY], years))
+        filter_data(store, years, year_built, region, cubes[years])
+    report('filter_data, cube per years', time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in sorted(set(args.workers)):
+            batch_export._cube = None
+            start = time.perf_counter()
+            batch_export.export(os.path.join(tmp, 'out.parquet'), [COUNTY], workers)
+            report(f'batch_export, {workers} workers', time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# time the map + KPI numbers for the default sidebar state, computed by
+# masking the full table vs. answered from the (GEOID, year, vintage) cube
+#
+#   python -m benchmarks.cube_queries [--scales 1 10 100]
+
+import argparse
+import time
+
+import sales_cube
+import sales_data
+from benchmarks.synthetic import scale_sales
+
+YEARS = (2021, 2023)
+YEAR_BUILT = ('2000-2010', '2011-2023')
+
+
+def table_scan(df):
+    lower = sales_cube.VINTAGE_BUCKETS[YEAR_BUILT[0]][0]
+    upper = sales_cube.VINTAGE_BUCKETS[YEAR_BUILT[1]][1]
+    filtered = df[(df['year_blt'] >= lower) & (df['year_blt'] <= upper)]
+    selected = filtered[(filtered['year_sale'] >= YEARS[0]) &
+                        (filtered['year_sale'] <= YEARS[1])]
+    selected.groupby('GEOID').agg(**{
+        'price_sf': ('price_sf', 'median'),
+        'Sale Price': ('Sale Price', 'median'),
+        'year_blt': ('year_blt', 'median'),
+        'count': ('price_sf', 'size'),
+    })
+    for measure in sales_cube.CUBE_MEASURES:
+        selected[measure].median()
+    filtered[filtered['year_sale'] == YEARS[0]]['price_sf'].median()
+    filtered[filtered['year_sale'] == YEARS[1]]['price_sf'].median()
+
+
+def cube_query(cube):
+    cube.tract_table(YEARS, YEAR_BUILT)
+    cube.kpis(YEARS, YEAR_BUILT)
+
+
+def timed(fn, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    base = sales_data.load_sales()
+
+    print(f"{'rows':>10} {'scan ms':>9} {'cube build ms':>14} {'cube query ms':>14}")
+    for factor in args.scales:
+        df = scale_sales(base, factor)
+        build = timed(lambda: sales_cube.SalesCube(df), repeat=1)
+        cube = sales_cube.SalesCube(df)
+        print(f"{len(df):>10,} {timed(lambda: table_scan(df)):>9.1f} {build:>14.1f} {timed(lambda: cube_query(cube)):>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# compare handing out the sales table through st.cache_data (every rerun
+# unpickles its own copy) with the shared read-only frame from
+# sales_data.freeze() behind st.cache_resource.
+#
+#   python -m benchmarks.dataset_sharing [--sessions 20]
+
+import argparse
+import pickle
+import time
+import tracemalloc
+
+import sales_data
+from benchmarks.synthetic import scale_sales
+
+
+def measure(fn, repeat):
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=20,
+                        help='concurrent sessions holding a copy of the data')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    base = sales_data.read_sales_csv()
+
+    print(f"{'rows':>10} {'mode':>14} {'per rerun ms':>13} {'MB / session':>13} {f'MB @ {args.sessions} sessions':>18}")
+    for factor in args.scales:
+        df = scale_sales(base, factor)
+        rows = len(df)
+
+        # st.cache_data: pickled once, unpickled on every call
+        blob = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        copies = []
+        _, per_call, copy_bytes = measure(
+            lambda: copies.append(pickle.loads(blob)), 1)
+        _, per_call, _ = measure(lambda: pickle.loads(blob), 5)
+        del copies
+        total = len(blob) + copy_bytes * args.sessions
+        print(f"{rows:>10,} {'cache_data':>14} {per_call * 1e3:>13.2f} {copy_bytes / 1e6:>13.1f} {total / 1e6:>18.1f}")
+
+        # st.cache_resource + freeze: built once, every session sees the same frame
+        # (built from a fresh copy so the string objects are counted too)
+        frozen, _, frozen_bytes = measure(
+            lambda: sales_data.freeze(pickle.loads(blob)), 1)
+        shared = {'df': frozen}
+        _, per_call, view_bytes = measure(lambda: shared['df'], 1000)
+        total = frozen_bytes + view_bytes * args.sessions
+        print(f"{rows:>10,} {'shared frozen':>14} {per_call * 1e3:>13.4f} {view_bytes / 1e6:>13.1f} {total / 1e6:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
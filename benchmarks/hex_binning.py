@@ -0,0 +1,49 @@
+# sales density layer: time to bin the geocoded sales into hexagons at the
+# map's zoom, and what pydeck gets sent (the hexes) vs. what a client-side
+# HexagonLayer would need (every sale's lat / long / price), at growing row
+# counts. copies of the geocoded sales are jittered by ~100 m
+#
+#   python -m benchmarks.hex_binning [--scales 1 100 1000] [--zoom 9.2]
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import sales_data
+import sales_hex
+from benchmarks.synthetic import scale_sales
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100, 1000])
+    parser.add_argument('--zoom', type=float, default=9.2)
+    args = parser.parse_args()
+
+    sales = sales_data.SalesStore().select()
+    geocoded = sales[np.isfinite(sales['lat'].to_numpy())].reset_index(drop=True)
+
+    print(f"{'sales':>10} {'bin ms':>8} {'hexes':>6} {'hex KB':>8} {'points KB':>10}")
+    for factor in args.scales:
+        df = scale_sales(geocoded, factor)
+        rng = np.random.default_rng(factor)
+        lat = df['lat'].to_numpy(dtype=np.float64) + rng.normal(0, 0.001, len(df))
+        long = df['long'].to_numpy(dtype=np.float64) + rng.normal(0, 0.001, len(df))
+
+        start = time.perf_counter()
+        hexes = sales_hex.hex_bins(lat, long, df['price_sf'], args.zoom)
+        bin_ms = (time.perf_counter() - start) * 1e3
+
+        hex_kb = len(json.dumps(hexes.to_dict(orient='records'))) / 1024
+        # raw points, estimated from a sample to keep the benchmark quick
+        sample = min(len(df), 10_000)
+        points = json.dumps([[round(y, 5), round(x, 5), round(float(p), 2)] for y, x, p in
+                             zip(lat[:sample], long[:sample], df['price_sf'][:sample])])
+        points_kb = len(points) / 1024 * len(df) / sample
+        print(f'{len(df):>10,} {bin_ms:>8.1f} {len(hexes):>6,} {hex_kb:>8.1f} {points_kb:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# server-side cost of building the tract map layer as the tract count grows:
+# the old per-render path (three .apply formatters and an equal-width pd.cut
+# into the colors) vs. map_layers.layer_table, and what toggling the view or
+# base map costs now that the table is cached (records + deck only). copies of
+# the Forsyth tracts get new GEOIDs and reuse the z10 shapes
+#
+#   python -m benchmarks.layer_build [--tracts 48 1000 10000 50000]
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import map_layers
+import sales_cube
+import sales_data
+import tract_geometry
+
+YEARS = (2021, 2023)
+YEAR_BUILT = ('2000-2010', '2011-2023')
+MAP_ZOOM = 9.2
+
+
+def scale_tracts(table, shapes, n_tracts):
+    # n_tracts rows cycled from the real table, each with its own GEOID
+    rows = np.arange(n_tracts) % len(table)
+    df = table.iloc[rows].reset_index(drop=True)
+    geoids = df['GEOID'].to_numpy() + np.arange(n_tracts) // len(table) * 10 ** 12
+    scaled = {g: shapes[g0] for g, g0 in zip(geoids.tolist(), df['GEOID'].tolist())}
+    return df.assign(GEOID=geoids), scaled
+
+
+def apply_table(grouped_df):
+    # the attribute columns as mapper_2D() used to build them on every render
+    joined_df = grouped_df.copy()
+    joined_df['price_sf_formatted'] = joined_df['price_sf'].apply(
+        lambda x: "${:.0f}".format((x)))
+    joined_df['price_formatted'] = joined_df['Sale Price'].apply(
+        lambda x: "${:,.0f}".format((x)))
+    joined_df['total_sales'] = joined_df['count'].apply(
+        lambda x: '{:,}'.format(x))
+    joined_df['choro_color'] = pd.cut(
+        joined_df['price_sf'],
+        bins=len(map_layers.CUSTOM_COLORS),
+        labels=map_layers.CUSTOM_COLORS,
+        include_lowest=True,
+        duplicates='drop'
+    )
+    return joined_df
+
+
+def timed(fn, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tracts', type=int, nargs='+', default=[48, 1000, 10000, 50000])
+    args = parser.parse_args()
+
+    sales = sales_data.SalesStore().select(['Forsyth'])
+    breaks = map_layers.price_breaks(sales)
+    cube = sales_cube.SalesCube(sales[sales['year_sale'].between(*YEARS)])
+    table = cube.tract_table(YEARS, YEAR_BUILT)
+    shapes = tract_geometry.shapes_for_zoom(tract_geometry.load_tract_lods(), MAP_ZOOM)
+    center = tract_geometry.view_center(shapes)
+
+    print(f"{'tracts':>8} {'apply ms':>9} {'vector ms':>10} {'records ms':>11} {'toggle ms':>10}")
+    for n in args.tracts:
+        df, scaled = scale_tracts(table, shapes, n)
+        apply_ms = timed(lambda: apply_table(df))
+        vector_ms = timed(lambda: map_layers.layer_table(df, breaks))
+        cached = map_layers.layer_table(df, breaks)
+        records_ms = timed(lambda: tract_geometry.tract_records(scaled, cached))
+        toggle_ms = timed(lambda: map_layers.map_deck(
+            tract_geometry.tract_records(scaled, cached), 'tracts', '3D', 'light',
+            center, MAP_ZOOM))
+        print(f'{n:>8,} {apply_ms:>9.1f} {vector_ms:>10.1f} {records_ms:>11.1f} {toggle_ms:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# what a data update costs the caches: the share of warmed filter states
+# (see warmup.py) whose KPI, map and chart results a new dataset invalidates,
+# for a monthly append of new sales across the county and for a csv fix of
+# one old sale, and the time to write the update and open the new store.
+# before per-tract data versions, both invalidated everything
+#
+#   python -m benchmarks.live_reload [--sales 3000]
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import dash_views
+import map_layers
+import sales_data
+import warmup
+
+COUNTY = 'Forsyth'
+
+
+def state_versions(store):
+    # (kind, filter state) -> data version, for every warmed state
+    breaks = dash_views.breaks_version(map_layers.price_breaks(store.select([COUNTY])))
+    versions = {}
+    for years, filters in warmup.filter_states(store, COUNTY).items():
+        for year_built, geography_included, sub_geo in filters:
+            state = (years, year_built, geography_included, tuple(sub_geo))
+            v = dash_views.data_versions(store, COUNTY, years, geography_included, sub_geo)
+            versions['kpi', state] = v['filter']
+            versions['map', state] = f"{v['filter']}.{breaks}"
+            versions['chart', state] = v['trend']
+    return versions
+
+
+def add_batch(df, partitions_dir, name):
+    keys = sales_data.write_partitioned(df, os.path.join(partitions_dir, name), {})
+    catalog = sales_data.read_catalog(partitions_dir)
+    catalog['version'] += 1
+    catalog['partitions'].append({'name': name, 'rows': len(df), 'segments': keys})
+    sales_data.write_json(catalog, os.path.join(partitions_dir, 'catalog.json'))
+
+
+def report(name, before, store, seconds):
+    after = state_versions(store)
+    for kind in ('kpi', 'map', 'chart'):
+        states = [k for k in before if k[0] == kind]
+        changed = sum(before[k] != after[k] for k in states)
+        print(f'{name:>22} {kind:>6} {changed:>5} / {len(states):<5} {changed / len(states):>6.0%}')
+    print(f'{"":>22} write + open the new store: {seconds * 1e3:.0f} ms')
+    return after
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sales', type=int, default=3000,
+                        help='sales in the monthly append')
+    args = parser.parse_args()
+
+    base = sales_data.SalesStore().select([COUNTY])
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_dir = os.path.join(tmp, 'snapshot')
+        partitions_dir = os.path.join(tmp, 'partitions')
+        os.makedirs(partitions_dir)
+        sales_data.write_partitioned(base, snapshot_dir, {})
+        before = state_versions(sales_data.SalesStore(None, snapshot_dir, partitions_dir))
+        print(f"{'update':>22} {'result':>6} {'invalidated':>13}")
+
+        # a month of new sales in the latest sale year, all over the county
+        latest = base[base['year_sale'] == base['year_sale'].max()]
+        month = latest.iloc[rng.integers(0, len(latest), args.sales)]
+        month = month.assign(month_idx=np.full(len(month), latest['month_idx'].max(),
+                                               dtype=np.int16))
+        start = time.perf_counter()
+        add_batch(month.reset_index(drop=True), partitions_dir, 'part-00001')
+        store = sales_data.SalesStore(None, snapshot_dir, partitions_dir)
+        before = report(f'monthly append ({args.sales:,})', before, store,
+                        time.perf_counter() - start)
+
+        # one corrected sale price in the oldest sale year, as a rewritten csv
+        # snapshot would carry it
+        prices = base['Sale Price'].to_numpy().copy()
+        prices[np.flatnonzero(base['year_sale'] == base['year_sale'].min())[0]] += 1000
+        fixed = base.assign(**{'Sale Price': prices})
+        start = time.perf_counter()
+        sales_data.write_partitioned(fixed, snapshot_dir, {})
+        store = sales_data.SalesStore(None, snapshot_dir, partitions_dir)
+        report('one old sale fixed', before, store, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
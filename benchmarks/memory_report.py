@@ -0,0 +1,47 @@
+# bytes per sale, column by column, of the table the dashboard used to keep
+# in memory (the csv as read, with string prices, unique_ID and the
+# year / month / 'year-month' columns) vs. the compact core table served by
+# sales_data.SalesStore. pandas deep memory usage, index included
+#
+#   python -m benchmarks.memory_report
+
+import pandas as pd
+
+import sales_data
+
+# what load_tab_data() returned before the typed snapshot
+ORIGINAL_COLUMNS = ['Square Ft', 'year_sale', 'year_blt', 'price_sf', 'Sale Price',
+                    'GEOID', 'Sub_geo', 'unique_ID', 'year', 'month', 'year-month']
+
+
+def original_table(path=sales_data.SALES_CSV):
+    df = pd.read_csv(path, thousands=',', keep_default_na=False)
+    df['Sale Price'] = df['Sale Price'].str.replace('[\\$,]', '', regex=True)
+    return df[ORIGINAL_COLUMNS]
+
+
+def bytes_per_row(df):
+    usage = df.memory_usage(deep=True, index=True) / len(df)
+    return usage.rename({'Index': '(index)'})
+
+
+def main():
+    compact = sales_data.SalesStore().select()
+    before = bytes_per_row(original_table())
+    after = bytes_per_row(compact)
+    order = ['(index)'] + ORIGINAL_COLUMNS + [c for c in compact.columns
+                                             if c not in ORIGINAL_COLUMNS]
+    report = pd.DataFrame({'before': before, 'after': after}).reindex(order).fillna(0)
+
+    print(f"{'column':>12} {'before B/row':>13} {'after B/row':>12}")
+    for col, row in report.iterrows():
+        print(f"{col:>12} {row['before']:>13.1f} {row['after']:>12.1f}")
+    total = report.sum()
+    print(f"{'total':>12} {total['before']:>13.1f} {total['after']:>12.1f}   "
+          f"({total['before'] / total['after']:.1f}x smaller)")
+    print(f"{len(compact):,} sales: {total['before'] * len(compact) / 1e6:.1f} MB before, "
+          f"{total['after'] * len(compact) / 1e6:.1f} MB after, per copy held")
+
+
+if __name__ == '__main__':
+    main()
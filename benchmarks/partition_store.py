@@ -0,0 +1,64 @@
+# startup cost and memory of the partitioned sales store as counties are
+# added. every synthetic county is a copy of the Forsyth sales with its GEOIDs
+# moved to another county FIPS code, written as a (county, sale year)
+# partitioned snapshot in a temp directory. opening the store and answering
+# one county's default filter should cost the same at 1 county as at 50
+#
+#   python -m benchmarks.partition_store [--counties 1 10 50]
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import sales_cube
+import sales_data
+
+YEARS = (2021, 2023)
+YEAR_BUILT = ('2000-2010', '2011-2023')
+
+
+def write_counties(base, n_counties, out_dir):
+    # county i gets FIPS 13117 + 1000 * i; all but Forsyth go by their code
+    frames = []
+    for i in range(n_counties):
+        df = base.copy()
+        df['GEOID'] = df['GEOID'].to_numpy() + np.int64(1000 * i) * 10 ** 6
+        frames.append(df)
+    sales_data.write_partitioned(sales_data.concat_sales(frames), out_dir, {})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--counties', type=int, nargs='+', default=[1, 10, 50])
+    args = parser.parse_args()
+
+    base = sales_data.read_sales_csv()
+
+    print(f"{'counties':>9} {'rows':>11} {'open ms':>8} {'open KB':>8} {'query ms':>9} {'resident KB':>12}")
+    for n in args.counties:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_counties(base, n, tmp)
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            store = sales_data.SalesStore(None, tmp, os.path.join(tmp, 'no_batches'))
+            open_ms = (time.perf_counter() - start) * 1e3
+            open_kb = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            cube = sales_cube.SalesCube(store.select(['Forsyth'], YEARS))
+            cube.tract_table(YEARS, YEAR_BUILT)
+            cube.kpis(YEARS, YEAR_BUILT)
+            query_ms = (time.perf_counter() - start) * 1e3
+
+            print(f'{n:>9} {n * len(base):>11,} {open_ms:>8.1f} {open_kb:>8.0f} '
+                  f'{query_ms:>9.1f} {store.resident_bytes / 1024:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# comparison mode: each group's KPIs and monthly price / SF series side by
+# side. one kpis() / series() call per group vs. the single pass of
+# SalesCube.group_kpis() and MonthlySeries.compare(), as the number of groups
+# grows. groups are Forsyth's sub-geographies, then single tracts (a series
+# store keyed by GEOID in place of Sub_geo) up to every tract in the county.
+# 'merged' is the same selection as one group, the dashboard's usual merged
+# view: the single pass should track it, costing what its cells cost rather
+# than growing per group. results of both paths are checked equal
+#
+#   python -m benchmarks.region_compare [--groups 1 2 4 8 16 32 48] [--window 1]
+
+import argparse
+import time
+
+import pandas as pd
+
+import sales_cube
+import sales_data
+
+COUNTY = 'Forsyth'
+YEARS = (2021, 2023)
+YEAR_BUILT = ('<2000', '2011-2023')
+
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best * 1e3
+
+
+def per_group_series(series, groups, window):
+    return pd.concat([series.series(YEAR_BUILT, [g], window).assign(Sub_geo=g)
+                      for g in groups], ignore_index=True)
+
+
+def report(name, n, merged_ms, loop_ms, single_ms):
+    print(f'{name:>11} {n:>4} {merged_ms:>10.1f} {loop_ms:>9.1f} {single_ms:>10.1f} '
+          f'{loop_ms / single_ms:>8.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--groups', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 48])
+    parser.add_argument('--window', type=int, default=1)
+    args = parser.parse_args()
+
+    sales = sales_data.SalesStore().select([COUNTY])
+    cube = sales_cube.SalesCube(sales[sales['year_sale'].between(*YEARS)].reset_index(drop=True))
+    sub_geos = sales_data.sub_geos(COUNTY)
+    region_series = sales_cube.MonthlySeries(sales)
+    # each tract as its own "region"
+    tracts = [str(g) for g in cube.geoids]
+    tract_series = sales_cube.MonthlySeries(
+        sales.assign(Sub_geo=sales['GEOID'].astype(str).astype('category')))
+
+    print(f"{'groups':>11} {'n':>4} {'merged ms':>10} {'loop ms':>9} {'single ms':>10} "
+          f"{'speedup':>9}")
+    for name, groups, series, geoid_groups in [
+            ('regions', sub_geos, region_series, [cube.geoids_in([g]) for g in sub_geos]),
+            ('tracts', tracts, tract_series, [[g] for g in cube.geoids])]:
+        for n in sorted({min(n, len(groups)) for n in args.groups}):
+            merged = [g for geoids in geoid_groups[:n] for g in geoids]
+            _, merged_ms = timed(lambda: cube.kpis(YEARS, YEAR_BUILT, merged))
+            loop, loop_ms = timed(lambda: [cube.kpis(YEARS, YEAR_BUILT, g)
+                                           for g in geoid_groups[:n]])
+            single, single_ms = timed(lambda: cube.group_kpis(YEARS, YEAR_BUILT,
+                                                              geoid_groups[:n]))
+            assert repr(loop) == repr(single)
+            report(f'{name} kpi', n, merged_ms, loop_ms, single_ms)
+
+            _, merged_ms = timed(lambda: series.series(YEAR_BUILT, groups[:n], args.window))
+            loop, loop_ms = timed(lambda: per_group_series(series, groups[:n], args.window))
+            single, single_ms = timed(lambda: series.compare(YEAR_BUILT, groups[:n], args.window))
+            pd.testing.assert_frame_equal(loop.sort_values(['Sub_geo', 'month_idx'])
+                                          .reset_index(drop=True)[single.columns],
+                                          single.sort_values(['Sub_geo', 'month_idx'])
+                                          .reset_index(drop=True), check_dtype=False)
+            report(f'{name} series', n, merged_ms, loop_ms, single_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# what the shared result cache saves: building the default tract map deck
+# (cube query, layer table, records, deck JSON) vs. reading it back from
+# SQLite, then the same read from several processes at once, as when a few
+# streamlit servers behind a load balancer get the same popular filter state
+#
+#   python -m benchmarks.result_cache [--processes 4] [--reads 50]
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import map_layers
+import result_cache
+import sales_cube
+import sales_data
+import tract_geometry
+
+YEARS = (2021, 2023)
+YEAR_BUILT = ('2000-2010', '2011-2023')
+MAP_ZOOM = 9.2
+STATE = {'county': 'Forsyth', 'years': YEARS, 'year_built': YEAR_BUILT,
+         'geography': 'Entire county', 'sub_geo': [], 'layer': 'Census tracts',
+         'view': '2D', 'base_map': 'Gray'}
+
+
+def build_deck():
+    store = sales_data.SalesStore()
+    breaks = map_layers.price_breaks(store.select(['Forsyth']))
+    cube = sales_cube.SalesCube(store.select(['Forsyth'], YEARS))
+    table = map_layers.layer_table(cube.tract_table(YEARS, YEAR_BUILT), breaks)
+    shapes = tract_geometry.shapes_for_zoom(tract_geometry.load_tract_lods(), MAP_ZOOM)
+    deck = map_layers.map_deck(tract_geometry.tract_records(shapes, table), 'tracts',
+                               '2D', 'light', tract_geometry.view_center(shapes), MAP_ZOOM)
+    return result_cache.deck_result(deck)
+
+
+def read_many(path, version, reads):
+    cache = result_cache.ResultCache(path)
+    start = time.perf_counter()
+    for _ in range(reads):
+        assert cache.get('map', STATE, version) is not None
+    return (time.perf_counter() - start) / reads * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--reads', type=int, default=50)
+    args = parser.parse_args()
+
+    version = sales_data.SalesStore().version_of(['Forsyth'], YEARS)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.sqlite')
+        cache = result_cache.ResultCache(path)
+
+        start = time.perf_counter()
+        value = build_deck()
+        build_ms = (time.perf_counter() - start) * 1e3
+        cache.put('map', STATE, value, version)
+        print(f"deck: {len(value['spec']) / 1024:.0f} KB")
+        print(f'build from the store (cold process): {build_ms:>8.1f} ms')
+        print(f'read from the cache, 1 process:      {read_many(path, version, args.reads):>8.1f} ms')
+
+        with ProcessPoolExecutor(args.processes) as pool:
+            per_read = list(pool.map(read_many, [path] * args.processes,
+                                     [version] * args.processes,
+                                     [args.reads] * args.processes))
+        print(f'read from the cache, {args.processes} processes:    '
+              f'{max(per_read):>8.1f} ms (slowest process)')
+
+        print(f"after a new data version: "
+              f"{'miss' if cache.get('map', STATE, version + '.next') is None else 'hit'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# rolling (trailing w-month) median of price / SF for the whole county:
+# a naive per-window pandas median over the raw rows vs. the monthly cell
+# store in sales_cube.MonthlySeries. the naive version re-reads every row of
+# every window, the cell store answers all windows in one quantile query
+#
+#   python -m benchmarks.rolling_median [--window 12] [--scales 1 10 100]
+
+import argparse
+import time
+
+import numpy as np
+
+import sales_cube
+import sales_data
+from benchmarks.synthetic import scale_sales
+
+YEAR_BUILT = ('<2000', '2011-2023')
+
+
+def naive(df, window):
+    month_idx = df['month_idx'].to_numpy()
+    price_sf = df['price_sf']
+    months = np.arange(month_idx.min() + window - 1, month_idx.max() + 1)
+    return [price_sf[(month_idx > m - window) & (month_idx <= m)].median()
+            for m in months]
+
+
+def timed(fn, repeat=3):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--window', type=int, default=12)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    base = sales_data.load_sales()
+
+    print(f"{'rows':>10} {'naive ms':>10} {'cells build ms':>15} {'cells query ms':>15} {'match':>6}")
+    for factor in args.scales:
+        df = scale_sales(base, factor)
+        expected, naive_ms = timed(lambda: naive(df, args.window), repeat=1)
+        series, build_ms = timed(lambda: sales_cube.MonthlySeries(df), repeat=1)
+        result, query_ms = timed(
+            lambda: series.series(YEAR_BUILT, window=args.window))
+        match = np.allclose(expected, result['price_sf'])
+        print(f"{len(df):>10,} {naive_ms:>10.1f} {build_ms:>15.1f} {query_ms:>15.1f} {str(match):>6}")
+
+
+if __name__ == '__main__':
+    main()
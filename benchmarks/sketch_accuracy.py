@@ -0,0 +1,107 @@
+# check the sketch engine against exact pandas quantiles for every
+# year x vintage x region state the sidebar allows, at the KPI level and per
+# tract. exits non-zero if any estimate falls outside its documented rank
+# bound (sales_sketch.py), and reports the worst relative error seen.
+# tests/test_sales_sketch.py runs the same check under pytest
+#
+#   python -m benchmarks.sketch_accuracy [--size 64] [--scale 1]
+
+import argparse
+import itertools
+import math
+import sys
+
+import numpy as np
+
+import sales_cube
+import sales_data
+from benchmarks.synthetic import scale_sales
+
+QUANTILES = [0.25, 0.5, 0.75]
+REGIONS = ['Cumming', 'North Forsyth', 'West Forsyth', 'South Forsyth']
+
+
+def filter_states(cube):
+    years = itertools.combinations_with_replacement(cube.years.tolist(), 2)
+    vintages = itertools.combinations_with_replacement(cube.vintages, 2)
+    regions = [None] + [(r,) for r in REGIONS]
+    return itertools.product(years, vintages, regions)
+
+
+def within_bound(exact_sorted, estimate, q, slack):
+    # estimate must sit between the values `slack` ranks either side of the
+    # interpolated target position
+    n = len(exact_sorted)
+    position = (n - 1) * q
+    low = exact_sorted[max(math.floor(position) - slack, 0)]
+    high = exact_sorted[min(math.ceil(position) + slack, n - 1)]
+    return low <= estimate <= high
+
+
+def check_bounds(df, size):
+    # every quantile the sketch engine gives for every filter state, checked
+    # against its rank bound. returns (quantiles checked, out-of-bound
+    # descriptions, worst relative median error per measure)
+    sketch = sales_cube.SalesCube(df, engine='sketch', sketch_size=size)
+    vintage_lowers = [b[0] for b in sales_cube.VINTAGE_BUCKETS.values()]
+    vintage_uppers = [b[1] for b in sales_cube.VINTAGE_BUCKETS.values()]
+
+    checked, violations = 0, []
+    worst = {measure: 0.0 for measure in sales_cube.CUBE_MEASURES}
+    for years, year_built, region in filter_states(sketch):
+        geoids = None if region is None else sketch.geoids_in(region)
+        cells = sketch.cells(years, year_built, geoids)
+
+        lower = vintage_lowers[sketch.vintages.index(year_built[0])]
+        upper = vintage_uppers[sketch.vintages.index(year_built[1])]
+        rows = df[(df['year_sale'] >= years[0]) & (df['year_sale'] <= years[1]) &
+                  (df['year_blt'] >= lower) & (df['year_blt'] <= upper)]
+        if geoids is not None:
+            rows = rows[rows['GEOID'].isin(geoids)]
+
+        # the whole selection (KPI row) plus every tract in it (map)
+        tract_ids = sketch.geoids if geoids is None \
+            else sketch.geoids[np.isin(sketch.geoids, geoids)]
+        groups = [cells.ravel()] + list(cells)
+        group_rows = [rows] + [rows[rows['GEOID'] == g] for g in tract_ids]
+
+        for measure in sales_cube.CUBE_MEASURES:
+            estimates = sketch.engine.quantiles(measure, groups, QUANTILES)
+            for cell_group, selected, estimate in zip(groups, group_rows, estimates):
+                if len(selected) == 0:
+                    continue
+                exact_sorted = np.sort(selected[measure].to_numpy())
+                slack = int(np.ceil(sketch.counts[cell_group] / size).sum())
+                for q, value in zip(QUANTILES, estimate):
+                    checked += 1
+                    if not within_bound(exact_sorted, value, q, slack):
+                        violations.append(f'{measure} q={q} {years} {year_built} {region}')
+
+                exact_median = np.median(exact_sorted)
+                if exact_median:
+                    worst[measure] = max(
+                        worst[measure], abs(estimate[1] - exact_median) / abs(exact_median))
+
+    return checked, violations, worst
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=sales_cube.SKETCH_SIZE)
+    parser.add_argument('--scale', type=int, default=1)
+    args = parser.parse_args()
+
+    df = scale_sales(sales_data.load_sales(), args.scale)
+    checked, violations, worst = check_bounds(df, args.size)
+    for violation in violations:
+        print(f'out of bound: {violation}')
+
+    print(f'{checked:,} quantiles checked at sketch size {args.size}, {len(violations)} out of bound')
+    for measure, error in worst.items():
+        print(f'  worst relative median error, {measure}: {error:.3%}')
+
+    return 1 if violations else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# every data stage behind one dashboard rerun, run headless on the sales csv
+# and on synthetic copies 10x / 100x / 1000x as large (see synthetic.py), with
+# wall time, peak traced memory and a result summary per stage. each run is
+# checked against benchmarks/baselines.json: a result that differs, or a stage
+# slower than TIME_TOLERANCE x its baseline, fails the run (exit status 1)
+#
+#   python -m benchmarks.stages [--scales 1 10 100] [--update]
+#
+# every scale starts from the sales csv alone, never the live store, so
+# ingest batches don't move the results. synthetic datasets are written as a
+# partitioned snapshot in a temp directory, copies past the first as ingest
+# batches, so no more than CHUNK_COPIES copies are in memory while writing.
+# 1000x is ~33M sales and needs ~8 GB of memory for the county-wide stages
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import dash_views
+import map_layers
+import sales_cube
+import sales_data
+import tract_geometry
+from benchmarks.synthetic import scale_sales
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+
+# a stage fails when slower than this many times its baseline, plus slack for
+# timer noise on the fast ones
+TIME_TOLERANCE = 2.0
+TIME_SLACK_MS = 25
+
+CHUNK_COPIES = 50
+
+COUNTY = 'Forsyth'
+
+
+def write_synthetic(base, factor, out_dir):
+    # `factor` jittered copies of the compact sales: the first chunk is the
+    # base snapshot, the rest are catalogued batches
+    snapshot_dir = os.path.join(out_dir, 'snapshot')
+    partitions_dir = os.path.join(out_dir, 'batches')
+    catalog = {'version': 0, 'partitions': [], 'partition_versions': {}}
+    for i, start in enumerate(range(0, factor, CHUNK_COPIES)):
+        df = scale_sales(base, min(CHUNK_COPIES, factor - start), seed=i)
+        if i == 0:
+            sales_data.write_partitioned(df, snapshot_dir, {})
+            continue
+        name = f'part-{i:05d}'
+        keys = sales_data.write_partitioned(df, os.path.join(partitions_dir, name), {})
+        catalog['partitions'].append({'name': name, 'rows': len(df), 'segments': keys})
+    os.makedirs(partitions_dir, exist_ok=True)
+    sales_data.write_json(catalog, os.path.join(partitions_dir, 'catalog.json'))
+    return snapshot_dir, partitions_dir
+
+
+def stages(snapshot_dir, partitions_dir, csv=False):
+    # (name, run(outputs) -> output, summary(output) -> dict) in rerun order.
+    # each stage reads what earlier ones produced from `outputs`, so any one
+    # can be rerun on its own
+    years = dash_views.default_years(
+        sales_data.SalesStore(None, snapshot_dir, partitions_dir).years(COUNTY))
+    year_built = dash_views.DEFAULT_YEAR_BUILT
+    geography, sub_geo = 'Entire county', ''
+
+    def load(_):
+        # a fresh store, so partitions are mapped from disk every time
+        store = sales_data.SalesStore(None, snapshot_dir, partitions_dir)
+        return store, store.select([COUNTY])
+
+    def select_years(out):
+        sales = out['load'][1]
+        return sales[sales['year_sale'].between(*years)].reset_index(drop=True)
+
+    def map_deck(out):
+        table = map_layers.layer_table(out['filter'][0], out['breaks'])
+        deck = dash_views.mapper(table, 'Census tracts', '2D', dash_views.DEFAULT_BASE_MAP,
+                                 *out['tract_view'])
+        return deck.to_json()
+
+    def hexes(out):
+        hex_df = dash_views.hex_table(out['select_years'], years, year_built,
+                                      geography, sub_geo)
+        return map_layers.layer_table(hex_df, out['breaks'])
+
+    def chart(out):
+        chart_df = out['series'].series(year_built, None, 1)
+        fig = dash_views.charter(chart_df, years, sub_geo)
+        return chart_df, dash_views.chart_result(fig)
+
+    def tract_view(_):
+        shapes = tract_geometry.shapes_for_zoom(tract_geometry.load_tract_lods(),
+                                                dash_views.MAP_ZOOM)
+        return shapes, tract_geometry.view_center(shapes)
+
+    def frame(df):
+        return {'rows': len(df), 'price_sf': float(df['price_sf'].sum())}
+
+    def series_summary(series):
+        # months covered, and the county's monthly medians over every vintage
+        monthly = series.series((dash_views.YEAR_BUILT_OPTIONS[0],
+                                 dash_views.YEAR_BUILT_OPTIONS[-1]), None, 1)
+        return {'months': len(series.months),
+                'median_sum': float(monthly['price_sf'].sum())}
+
+    return [
+        *([('csv', lambda _: sales_data.read_sales_csv(), frame)] if csv else []),
+        ('load', load, lambda out: frame(out[1])),
+        ('select_years', select_years, frame),
+        # one cube over all of the county's sale years, as the dashboard keeps it
+        ('cube', lambda out: sales_cube.SalesCube(out['load'][1]),
+         lambda cube: {'tracts': len(cube.geoids)}),
+        ('filter', lambda out: dash_views.filter_cube(out['cube'], years, year_built,
+                                                      geography, sub_geo),
+         lambda out: dict(frame(out[0]), total_sales=out[1]['total_sales'],
+                          median=float(out[1]['price_sf']))),
+        ('breaks', lambda out: map_layers.price_breaks(out['load'][1]),
+         lambda breaks: {'breaks': [float(b) for b in breaks]}),
+        ('tract_view', tract_view, lambda view: {'tracts': len(view[0])}),
+        ('map', map_deck, lambda spec: {'features': spec.count('"geometry"')}),
+        ('hex', hexes, lambda table: {'hexes': len(table), 'sales': int(table['count'].sum())}),
+        ('series', lambda out: sales_cube.MonthlySeries(out['load'][1]),
+         series_summary),
+        ('chart', chart, lambda out: frame(out[0])),
+    ]
+
+
+def run(stage_list, repeat):
+    # best-of-`repeat` wall time, then one traced run for peak memory
+    outputs, report = {}, {}
+    for name, fn, summary in stage_list:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            outputs[name] = fn(outputs)
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        fn(outputs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report[name] = {'ms': round(best * 1e3, 2), 'peak_kb': round(peak / 1024),
+                        'result': summary(outputs[name])}
+    return report
+
+
+def same_result(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_result(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(same_result(x, y) for x, y in zip(a, b))
+    return bool(np.isclose(a, b, rtol=1e-9, atol=1e-6))
+
+
+def check(scale, report, baselines):
+    # failure messages for one scale against its baseline
+    failures = []
+    for name, got in report.items():
+        base = baselines.get(scale, {}).get(name)
+        if base is None:
+            continue
+        if not same_result(got['result'], base['result']):
+            failures.append(f"{scale}x {name}: result {got['result']} != baseline {base['result']}")
+        if got['ms'] > base['ms'] * TIME_TOLERANCE + TIME_SLACK_MS:
+            failures.append(f"{scale}x {name}: {got['ms']:.1f} ms vs. baseline {base['ms']:.1f} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--update', action='store_true',
+                        help='store this run as the baselines instead of checking it')
+    args = parser.parse_args()
+
+    baselines = {}
+    if os.path.exists(BASELINES):
+        with open(BASELINES) as f:
+            baselines = json.load(f)
+
+    base = sales_data.read_sales_csv()
+    failures = []
+    print(f"{'scale':>6} {'stage':>13} {'ms':>9} {'base ms':>9} {'peak MB':>8}")
+    for factor in args.scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            snapshot_dir, partitions_dir = write_synthetic(base, factor, tmp)
+            report = run(stages(snapshot_dir, partitions_dir, csv=factor == 1), args.repeat)
+
+        scale = str(factor)
+        for name, got in report.items():
+            base_ms = baselines.get(scale, {}).get(name, {}).get('ms')
+            base_ms = f'{base_ms:>9.1f}' if base_ms is not None else f"{'-':>9}"
+            print(f"{factor:>5}x {name:>13} {got['ms']:>9.1f} {base_ms} "
+                  f"{got['peak_kb'] / 1024:>8.1f}")
+        if args.update:
+            baselines[scale] = report
+        else:
+            failures += check(scale, report, baselines)
+
+    if args.update:
+        sales_data.write_json(baselines, BASELINES)
+        print(f'baselines written to {BASELINES}')
+    for failure in failures:
+        print('REGRESSION', failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
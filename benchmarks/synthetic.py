@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+
+def scale_sales(df, factor, seed=0):
+    # blow the real sales table up by `factor`. each copy keeps the original
+    # tract / year / vintage mix but gets jittered prices and sizes, so medians
+    # and group sizes behave like real data instead of exact repeats
+    if factor == 1:
+        return df
+
+    rng = np.random.default_rng(seed)
+    out = df.loc[df.index.repeat(factor)].reset_index(drop=True)
+    n = len(out)
+
+    jitter = rng.normal(1.0, 0.05, n)
+    price = pd.to_numeric(out['Sale Price']).to_numpy() * jitter
+    sqft = np.maximum(
+        (out['Square Ft'].to_numpy() * rng.normal(1.0, 0.03, n)).round(), 75)
+    price = price.round().astype('int64')
+    if out['Sale Price'].dtype == object:
+        # the raw csv keeps prices as strings; leave them that way
+        price = price.astype(str)
+    out['Sale Price'] = price
+    out['Square Ft'] = sqft.astype('int64')
+    out['price_sf'] = pd.to_numeric(out['Sale Price']).to_numpy() / sqft
+
+    if 'unique_ID' in out.columns:
+        copy_no = np.tile(np.arange(factor), len(df)).astype(str)
+        out['unique_ID'] = out['unique_ID'].astype(str) + '-' + copy_no
+
+    return out
@@ -0,0 +1,69 @@
+# point-in-polygon tract assignment for geocoded sales: geopandas sjoin (what
+# ingest.py used to do) vs. the prepared polygons and longitude-sorted
+# bounding-box windows in tract_assign.TractIndex, on random points over the
+# county bounding box, a few of them deliberately invalid
+#
+#   python -m benchmarks.tract_assignment [--sizes 100000 1000000]
+
+import argparse
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+import tract_assign
+import tract_geometry
+
+# lon / lat bounds of the Forsyth tracts
+BBOX = (-84.259, 34.051, -83.926, 34.335)
+
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(BBOX[1], BBOX[3], n)
+    long = rng.uniform(BBOX[0], BBOX[2], n)
+    # the odd unresolved geocode, as it appears in GeocodedAddresses.csv
+    lat[rng.random(n) < 0.001] = np.nan
+    return pd.DataFrame({'lat': lat, 'long': long})
+
+
+def sjoin(df, tracts):
+    df = df[df['lat'].notna()]
+    points = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['long'], df['lat']),
+                              crs=tract_assign.POINTS_CRS)
+    joined = gpd.sjoin(points, tracts[['GEOID', 'geometry']], how='inner',
+                       predicate='within')
+    return joined[~joined.index.duplicated()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    tracts = gpd.read_file(tract_geometry.TRACTS_GPKG).to_crs(tract_assign.POINTS_CRS)
+    start = time.perf_counter()
+    index = tract_assign.TractIndex()
+    print(f'index build: {(time.perf_counter() - start) * 1e3:.1f} ms')
+
+    print(f"{'points':>10} {'sjoin ms':>10} {'index ms':>9} {'assigned':>10} {'match':>6}")
+    for n in args.sizes:
+        df = random_points(n)
+
+        start = time.perf_counter()
+        expected = sjoin(df, tracts)
+        sjoin_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        assigned, rejects = index.assign(df)
+        index_ms = (time.perf_counter() - start) * 1e3
+
+        match = (assigned.index.equals(expected.index.sort_values()) and
+                 (assigned['GEOID'].to_numpy() ==
+                  expected['GEOID'].astype('int64').sort_index().to_numpy()).all())
+        print(f'{n:>10,} {sjoin_ms:>10.1f} {index_ms:>9.1f} {len(assigned):>10,} {str(match):>6}')
+
+
+if __name__ == '__main__':
+    main()
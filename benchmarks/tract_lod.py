@@ -0,0 +1,83 @@
+# what each tract level of detail costs to ship: vertices, the map payload
+# (the pydeck JSON streamlit sends the browser, raw and gzipped) and the
+# server-side layer build + serialization time, for the default 2D map.
+# browser render time can't be measured headless; --html writes one page per
+# level to open and time in the browser's performance panel
+#
+#   python -m benchmarks.tract_lod [--html lod_pages]
+
+import argparse
+import gzip
+import os
+import time
+
+import pydeck as pdk
+import shapely
+from shapely.geometry import shape
+
+import sales_cube
+import sales_data
+import tract_geometry
+
+YEARS = (2021, 2023)
+YEAR_BUILT = ('2000-2010', '2011-2023')
+MAP_ZOOM = 9.2
+
+
+def level_name(levels, shapes):
+    zoom = next(z for z, s in levels if s is shapes)
+    return 'full' if zoom is None else f'z{zoom}'
+
+
+def deck(shapes, df, zoom):
+    center = tract_geometry.view_center(shapes)
+    layer = pdk.Layer(
+        "GeoJsonLayer",
+        tract_geometry.tract_records(shapes, df),
+        pickable=True,
+        stroked=True,
+        filled=True,
+        get_fill_color=[2, 43, 58, 120],
+        get_line_color=[0, 0, 0, 255],
+        line_width_min_pixels=1
+    )
+    return pdk.Deck(layers=layer, map_provider='carto', map_style='light',
+                    initial_view_state=pdk.ViewState(
+                        latitude=center[0], longitude=center[1], zoom=zoom))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--html', help='directory to write one page per level to')
+    args = parser.parse_args()
+
+    cube = sales_cube.SalesCube(sales_data.SalesStore().select(['Forsyth'], YEARS))
+    df = cube.tract_table(YEARS, YEAR_BUILT)
+
+    start = time.perf_counter()
+    levels = tract_geometry.load_tract_lods()
+    chosen = tract_geometry.shapes_for_zoom(levels, MAP_ZOOM)
+    print(f'levels built in {(time.perf_counter() - start) * 1e3:.0f} ms; the map opens '
+          f'at zoom {MAP_ZOOM} and gets {level_name(levels, chosen)}\n')
+
+    print(f"{'level':>6} {'vertices':>9} {'payload KB':>11} {'gzip KB':>8} {'build ms':>9}")
+    for zoom, shapes in levels:
+        vertices = shapely.get_num_coordinates(
+            [shape(geom) for geom in shapes.values()]).sum()
+
+        start = time.perf_counter()
+        payload = deck(shapes, df, MAP_ZOOM).to_json()
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        name = level_name(levels, shapes)
+        print(f'{name:>6} {vertices:>9,} {len(payload) / 1024:>11.1f} '
+              f'{len(gzip.compress(payload.encode())) / 1024:>8.1f} {build_ms:>9.1f}')
+
+        if args.html:
+            os.makedirs(args.html, exist_ok=True)
+            deck(shapes, df, MAP_ZOOM if zoom is None else zoom).to_html(
+                os.path.join(args.html, f'tracts_{name}.html'), open_browser=False)
+
+
+if __name__ == '__main__':
+    main()
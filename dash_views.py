@@ -0,0 +1,286 @@
+import json
+from datetime import date
+from itertools import combinations_with_replacement
+
+import pandas as pd
+import plotly.express as px
+
+import map_layers
+import result_cache
+import sales_data
+import sales_hex
+import tract_geometry
+
+# the dashboard's rendered results (map deck, trend chart, KPIs) for one
+# sidebar state, built without streamlit so warmup.py can render the same
+# results the dashboard would and put them in the shared result cache
+
+# zoom the maps open at
+MAP_ZOOM = 9.2
+
+YEAR_BUILT_OPTIONS = ['<2000', '2000-2010', '2011-2023']
+DEFAULT_YEAR_BUILT = ('2000-2010', '2011-2023')
+
+MAP_LAYERS = ('Census tracts', 'Sales density')
+MAP_VIEWS = ('2D', '3D')
+
+BASE_MAPS = {
+    'Streets': 'road',
+    'Satellite': 'satellite',
+    'Gray': 'light'
+}
+DEFAULT_BASE_MAP = 'Gray'
+
+TREND_WINDOWS = {
+    'None': 1,
+    '3 months': 3,
+    '6 months': 6,
+    '12 months': 12
+}
+
+# line colors of the regions in comparison mode, repeated past eight
+COMPARE_COLORS = ['#022B3A', '#FFFFFF', '#1F7A8C', '#BFDBF7', '#F4D35E',
+                  '#8E5572', '#5B8E7D', '#E1E5F2']
+
+
+def default_years(year_options):
+    # the last three sale years, or all of them when there are fewer
+    return (year_options[max(len(year_options) - 3, 0)], year_options[-1])
+
+
+def slider_ranges(options):
+    # every (low, high) a range slider over `options` can be set to
+    return list(combinations_with_replacement(options, 2))
+
+
+def regions(geography_included, sub_geo):
+    # the sub-geographies a filter keeps, None for the entire county
+    if geography_included == 'Sub-geography':
+        return sub_geo
+    return None
+
+
+# result cache keys: the sidebar state each result depends on
+
+
+def filter_state(county, years, year_built, geography_included, sub_geo, engine):
+    return {'county': county, 'years': years, 'year_built': year_built,
+            'geography': geography_included, 'sub_geo': list(sub_geo),
+            'engine': engine}
+
+
+def map_state(state, layer, view, base_map):
+    return dict(state, layer=layer, view=view, base_map=base_map)
+
+
+def chart_state(state, window):
+    return dict(state, window=window)
+
+
+def data_versions(store, county, years, geography_included, sub_geo):
+    # version of the data each result reads: just the sale years & tracts
+    # behind it, so a new csv or ingest leaves results over other years and
+    # regions cached. 'filter' covers the KPIs, tract table & hexes, 'trend'
+    # the chart (every sale year of the selected tracts)
+    geoids = None
+    if geography_included == 'Sub-geography':
+        geoids = sales_data.sub_geo_tracts(county, sub_geo)
+    return {'filter': store.version_of([county], years, geoids),
+            'trend': store.version_of([county], None, geoids)}
+
+
+def breaks_version(breaks):
+    # maps are also shaded by the county-wide color breaks
+    return ','.join(repr(float(b)) for b in breaks)
+
+
+def filter_cube(cube, years, year_built, geography_included, sub_geo):
+    # map & KPI numbers come straight from the pre-aggregated cells, no row scan
+    geoids = None
+    if geography_included == 'Sub-geography':
+        geoids = cube.geoids_in(sub_geo)
+
+    grouped_df = cube.tract_table(years, year_built, geoids)
+    kpi = cube.kpis(years, year_built, geoids)
+
+    return grouped_df, kpi
+
+
+def compare_cube(cube, years, year_built, sub_geo):
+    # kpis() of each selected region on its own, in one pass over the cube
+    return cube.group_kpis(years, year_built, [cube.geoids_in([region]) for region in sub_geo])
+
+
+def hex_table(sales, years, year_built, geography_included, sub_geo, zoom=MAP_ZOOM):
+    # the filtered sales binned into hexagons sized for the map zoom. only the
+    # per-hex medians & counts go to pydeck, never the sales themselves
+    sales = sales_hex.select_sales(sales, years, year_built,
+                                   regions(geography_included, sub_geo))
+    return sales_hex.hex_bins(sales['lat'], sales['long'], sales['price_sf'], zoom)
+
+
+def mapper(table, layer, view, base_map, tract_shapes, map_center):
+    # tract geometry is attached here rather than cached with the table, as
+    # the records are handed to pydeck as-is
+    if layer == 'Sales density':
+        records, geometry = table.to_dict(orient='records'), 'hexes'
+    else:
+        records, geometry = tract_geometry.tract_records(tract_shapes, table), 'tracts'
+    return map_layers.map_deck(records, geometry, view, BASE_MAPS[base_map],
+                               map_center, MAP_ZOOM)
+
+
+def map_result(table, deck):
+    # what the result cache keeps of a map: the deck and how many sales it shows
+    return {'deck': result_cache.deck_result(deck),
+            'located': int(table['count'].sum())}
+
+
+def month_dates(month_idx):
+    # integer month index -> first day of that month, for a true date axis
+    return pd.to_datetime({
+        'year': month_idx // 12,
+        'month': month_idx % 12 + 1,
+        'day': 1})
+
+
+def chart_layout(fig, chart_df, years, chart_title_text):
+    # title, axes & hover styling shared by the trend charts, and the orange
+    # lines marking the selected sale years
+
+    # set chart title style variables
+    chart_title_font_size = '17'
+    chart_title_color = '#FFFFFF'
+    chart_title_font_weight = '650'
+
+    chart_subtitle_font_size = '14'
+    chart_subtitle_color = '#022B3A'
+    chart_subtitle_font_weight = '650'
+
+    # update the fig
+    fig.update_layout(
+        title_text=f'<span style="font-size:{chart_title_font_size}px; font-weight:{chart_title_font_weight}; color:{chart_title_color}">{chart_title_text}</span><br><span style="font-size:{chart_subtitle_font_size}px; font-weight:{chart_subtitle_font_weight}; color:{chart_subtitle_color}"><i>Orange lines reflect range of selected years</i></span>',
+        title_x=0,
+        title_y=0.93,
+        margin=dict(
+            t=85
+        ),
+        hoverlabel=dict(
+            bgcolor="rgba(255, 255, 255, 0.8)",
+            bordercolor="#022B3A",
+            font_size=16,  # set the font size of the chart tooltip
+            font_color="#022B3A",
+            align="left"
+        ),
+        yaxis=dict(
+            linecolor="#022B3A",
+            title=None,
+            tickfont_color='#022B3A',
+            tickfont_size=13,
+            tickformat='$.0f',
+            showgrid=False
+        ),
+        xaxis=dict(
+            linecolor="#022B3A",
+            linewidth=1,
+            tickfont_color='#022B3A',
+            title=None,
+            tickangle=90,
+            tickfont_size=13,
+            tickformat='%b %Y',
+            dtick='M3'
+        ),
+        height=460,
+        hovermode="x unified")
+
+    # add shifting vertical lines: first month of the start year through the
+    # last month of the end year that has data
+    last_month = chart_df['month_idx'].max()
+    end_month = min(sales_data.month_index(years[1], 12), last_month)
+
+    fig.add_vline(x=date(years[0], 1, 1).isoformat(), line_width=2,
+                  line_dash="dash", line_color="#FF8966")
+    fig.add_vline(x=date(end_month // 12, end_month % 12 + 1, 1).isoformat(), line_width=2,
+                  line_dash="dash", line_color="#FF8966")
+
+
+def charter(chart_df, years, sub_geo, trend_df=None, window=1):
+    df_grouped = chart_df.assign(date=month_dates(chart_df['month_idx']))
+
+    fig = px.line(
+        df_grouped,
+        x="date",
+        y='price_sf',
+        custom_data=['count']
+    )
+
+    # modify the line itself
+    fig.update_traces(
+        mode="lines",
+        line_color='#022B3A',
+        hovertemplate="<br>".join([
+            # "<b>%{x}</b><br>",
+            "Median price / SF: <b>%{y}</b>",
+            "Total sales: <b>%{customdata[0]:,.0f}</b>"
+        ])
+    )
+
+    # optional rolling median overlay
+    if trend_df is not None:
+        fig.add_scatter(
+            x=month_dates(trend_df['month_idx']),
+            y=trend_df['price_sf'],
+            mode="lines",
+            line=dict(color='#FFFFFF', width=2, dash='dot'),
+            showlegend=False,
+            hovertemplate=f"{window}-month median: <b>%{{y:$.0f}}</b><extra></extra>"
+        )
+
+    if sub_geo == "":
+        chart_title_text = "Countywide Median Price / SF"
+    elif len(sub_geo) == 1:
+        chart_title_text = f"{sub_geo[0]} Median Price / SF"
+    elif len(sub_geo) == 2:
+        chart_title_text = f"{sub_geo[0]} & {sub_geo[1]} Median Price / SF"
+    else:
+        chart_title_text = f"Median Price / SF For Selected Regions"
+
+    chart_layout(fig, chart_df, years, chart_title_text)
+
+    return fig
+
+
+def compare_charter(compare_df, years, window=1):
+    # one line per region, from MonthlySeries.compare(). with window > 1 the
+    # lines are the regions' rolling medians instead of the monthly ones
+    df_grouped = compare_df.assign(date=month_dates(compare_df['month_idx']))
+
+    fig = px.line(
+        df_grouped,
+        x="date",
+        y='price_sf',
+        color='Sub_geo',
+        custom_data=['count'],
+        color_discrete_sequence=COMPARE_COLORS
+    )
+
+    median_label = "Median price / SF" if window == 1 else f"{window}-month median"
+    fig.update_traces(
+        mode="lines",
+        hovertemplate=f"{median_label}: <b>%{{y:$.0f}}</b> (%{{customdata[0]:,.0f}} sales)"
+    )
+    fig.update_layout(
+        legend=dict(
+            title=None,
+            font_color='#022B3A'
+        )
+    )
+
+    chart_layout(fig, compare_df, years, "Median Price / SF By Region")
+
+    return fig
+
+
+def chart_result(fig):
+    # the figure as the JSON dict st.plotly_chart accepts
+    return json.loads(fig.to_json())
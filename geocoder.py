@@ -0,0 +1,303 @@
+import argparse
+import json
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode
+from urllib.request import urlopen
+
+import pandas as pd
+
+# what each county's export addresses get appended to before geocoding,
+# by county name (as in sales_data.COUNTIES)
+ADDRESS_SUFFIXES = {
+    'Forsyth': ' Forsyth County, GA',
+}
+
+GEOCODE_CACHE = 'NewSales/geocode_cache.sqlite'
+
+
+def normalize_address(address):
+    # cache key: upper case, no punctuation, single spaces
+    address = re.sub(r'[^\w\s]', ' ', str(address).upper())
+    return ' '.join(address.split())
+
+
+class GeocodeError(Exception):
+    # transient backend failure (timeout, throttling, browser crash); retried
+    pass
+
+
+class AddressCache:
+    # on-disk results keyed by normalized address. only 'ok' rows count as
+    # hits, so addresses that were not found or errored are retried next run
+
+    def __init__(self, path=GEOCODE_CACHE):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                address TEXT PRIMARY KEY,
+                lat REAL,
+                long REAL,
+                status TEXT NOT NULL,
+                backend TEXT,
+                attempts INTEGER NOT NULL,
+                updated REAL NOT NULL
+            )""")
+        self._db.commit()
+
+    def get(self, address):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT lat, long FROM geocodes WHERE address = ? AND status = 'ok'",
+                (normalize_address(address),)).fetchone()
+        return row
+
+    def put(self, address, coords, status, backend, attempts):
+        lat, long = coords if coords else (None, None)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_address(address), lat, long, status, backend,
+                 attempts, time.time()))
+            self._db.commit()
+
+    def coordinates(self):
+        # every resolved address -> (lat, long)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT address, lat, long FROM geocodes WHERE status = 'ok'").fetchall()
+        return {address: (lat, long) for address, lat, long in rows}
+
+    def close(self):
+        self._db.close()
+
+
+# backends: anything with a `name` and a `geocode(address)` that returns
+# (lat, long), None when the address can't be found, or raises GeocodeError.
+# a backend with `stores_results = False` never writes to the cache
+
+
+class CensusBackend:
+    # US Census Bureau one-line address geocoder; free, no key
+    name = 'census'
+    url = 'https://geocoding.geo.census.gov/geocoder/locations/onelineaddress'
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def geocode(self, address):
+        query = urlencode({'address': address,
+                           'benchmark': 'Public_AR_Current',
+                           'format': 'json'})
+        try:
+            with urlopen(f'{self.url}?{query}', timeout=self.timeout) as response:
+                payload = json.load(response)
+            # error payloads ({"errors": [...]}) and anything else without
+            # matches are retried like a failed request
+            matches = payload['result']['addressMatches']
+            if not matches:
+                return None
+            coords = matches[0]['coordinates']
+            return float(coords['y']), float(coords['x'])
+        except (OSError, ValueError) as e:
+            raise GeocodeError(str(e)) from e
+        except (KeyError, IndexError, TypeError) as e:
+            raise GeocodeError(f'unexpected response: {e!r}') from e
+
+
+class GoogleMapsBackend:
+    # the original notebook approach: load the maps search page in headless
+    # Chrome and read '/@lat,long,17z' out of the redirected url. one driver
+    # per worker thread
+    name = 'google'
+
+    def __init__(self, wait=3.7):
+        self.wait = wait
+        self._local = threading.local()
+        self._drivers = []
+
+    def _driver(self):
+        if not hasattr(self._local, 'driver'):
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+
+            options = Options()
+            options.add_argument("--headless=new")
+            self._local.driver = webdriver.Chrome(options=options)
+            self._drivers.append(self._local.driver)
+        return self._local.driver
+
+    def geocode(self, address):
+        driver = self._driver()
+        try:
+            driver.get('https://www.google.com/maps/search/' + quote(address))
+            time.sleep(self.wait)
+            url = driver.current_url
+        except Exception as e:
+            raise GeocodeError(str(e)) from e
+
+        found = re.search('/@(.+?),(.+?),17z', url)
+        if found is None:
+            return None
+        return float(found.group(1)), float(found.group(2))
+
+    def close(self):
+        for driver in self._drivers:
+            driver.quit()
+
+
+class CannedBackend:
+    # offline stand-in serving known answers with a configurable delay, plus
+    # optional random transient failures, for exercising concurrency, retries
+    # and the cache without touching the network
+    name = 'canned'
+
+    def __init__(self, responses, latency=0.0, error_rate=0.0, seed=None):
+        self.responses = {normalize_address(a): c for a, c in responses.items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        # e.g. a previous GeocodedAddresses.csv (full_address, lat, long)
+        df = pd.read_csv(path)
+        df = df[pd.to_numeric(df['lat'], errors='coerce').notna()]
+        return cls(dict(zip(df['full_address'],
+                            zip(df['lat'].astype(float), df['long'].astype(float)))),
+                   **kwargs)
+
+    def geocode(self, address):
+        with self._lock:
+            self.calls[normalize_address(address)] += 1
+            fail = self._random.random() < self.error_rate
+        time.sleep(self.latency)
+        if fail:
+            raise GeocodeError('canned transient failure')
+        return self.responses.get(normalize_address(address))
+
+
+class CacheOnlyBackend:
+    # answers nothing, so only cached addresses resolve. its 'not found'
+    # means "not looked up", so it writes nothing to the cache; a later
+    # online run still tries those addresses
+    name = 'cache'
+    stores_results = False
+
+    def geocode(self, address):
+        return None
+
+
+BACKENDS = {
+    'census': CensusBackend,
+    'google': GoogleMapsBackend,
+}
+
+
+def geocode_addresses(addresses, backend, cache, workers=8, retries=3,
+                      backoff=1.0):
+    # resolve every address, cache first. up to `workers` backend calls run at
+    # once; GeocodeErrors are retried with exponential backoff and jitter.
+    # returns a frame of full_address / lat / long / geocode_status and a
+    # Counter of what happened
+    stats = Counter()
+    stats_lock = threading.Lock()
+    stores_results = getattr(backend, 'stores_results', True)
+
+    def count(key, n=1):
+        with stats_lock:
+            stats[key] += n
+
+    def resolve(address):
+        cached = cache.get(address)
+        if cached is not None:
+            count('cached')
+            return cached, 'ok'
+
+        for attempt in range(1, retries + 2):
+            try:
+                coords = backend.geocode(address)
+            except GeocodeError:
+                count('errors')
+                if attempt > retries:
+                    if stores_results:
+                        cache.put(address, None, 'error', backend.name, attempt)
+                    count('failed')
+                    return None, 'error'
+                count('retries')
+                time.sleep(backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+                continue
+
+            status = 'ok' if coords is not None else 'not_found'
+            if stores_results:
+                cache.put(address, coords, status, backend.name, attempt)
+            count('resolved' if coords is not None else 'not_found')
+            return coords, status
+
+    # the same (normalized) address only needs resolving once per run
+    unique = {}
+    for address in addresses:
+        unique.setdefault(normalize_address(address), address)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(unique, pool.map(resolve, unique.values())))
+
+    rows = []
+    for address in addresses:
+        coords, status = results[normalize_address(address)]
+        lat, long = coords if coords is not None else (None, None)
+        rows.append((address, lat, long, status))
+
+    return pd.DataFrame(rows, columns=['full_address', 'lat', 'long', 'geocode_status']), stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Geocode the addresses in a county sales export.')
+    parser.add_argument('sales_csv', help="csv with an 'Address' column, e.g. NewSales/Forsyth_2023.csv")
+    parser.add_argument('--county', choices=list(ADDRESS_SUFFIXES), default='Forsyth',
+                        help='county the export is from')
+    parser.add_argument('--out', default='GeocodedAddresses.csv')
+    parser.add_argument('--backend', choices=list(BACKENDS) + ['canned'], default='census')
+    parser.add_argument('--canned', help='csv of known full_address/lat/long for --backend canned')
+    parser.add_argument('--latency', type=float, default=0.0, help='per-call delay for --backend canned')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--cache', default=GEOCODE_CACHE)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.sales_csv)
+    df['full_address'] = df['Address'] + ADDRESS_SUFFIXES[args.county]
+
+    if args.backend == 'canned':
+        backend = CannedBackend.from_csv(args.canned, latency=args.latency)
+    else:
+        backend = BACKENDS[args.backend]()
+    cache = AddressCache(args.cache)
+
+    start = time.perf_counter()
+    try:
+        geocoded, stats = geocode_addresses(
+            df['full_address'].tolist(), backend, cache,
+            workers=args.workers, retries=args.retries)
+    finally:
+        cache.close()
+        if hasattr(backend, 'close'):
+            backend.close()
+
+    geocoded.to_csv(args.out, index=False)
+
+    total = len(geocoded)
+    manuals = (geocoded['geocode_status'] != 'ok').sum()
+    print(f'Geocoded {total:,} addresses in {time.perf_counter() - start:.1f}s: '
+          f"{stats['cached']:,} from cache, {stats['resolved']:,} resolved, "
+          f"{stats['not_found']:,} not found, {stats['failed']:,} failed "
+          f"({stats['retries']:,} retries)")
+    print(f'Addresses to manually geocode: {manuals} out of {total}, or {manuals / total:.1%} of the total')
@@ -0,0 +1,232 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import geocoder
+import result_cache
+import sales_data
+import tract_assign
+import tract_geometry
+import warmup
+
+# hashed unique_ID of every sale already in the dataset, sorted uint64
+SALE_INDEX = 'sale_ids.npy'
+
+# sales that could not be placed in a tract, for manual geocoding
+INGEST_REJECTS = 'NewSales/ingest_rejects.csv'
+
+# raw export headers -> dashboard column names
+EXPORT_RENAMES = {
+    'Year  Built ': 'year_blt',
+    'Square Ft ': 'Square Ft',
+}
+
+
+def read_export(path):
+    # county sales export, as downloaded (.xlsx, needs openpyxl) or saved as csv
+    if path.endswith('.xlsx'):
+        return pd.read_excel(path, dtype={'Sale Date': str})
+    return pd.read_csv(path, encoding='utf-8-sig', dtype={'Sale Date': str})
+
+
+def clean_export(df, county):
+    # same rules as DataEngineering.ipynb: qualified sales only, over $1,000,
+    # over 75 SF. addresses are completed with the county's suffix
+    df = df.rename(columns=EXPORT_RENAMES)
+    df['full_address'] = df['Address'] + geocoder.ADDRESS_SUFFIXES[county]
+    df['sale_date'] = sales_data.parse_sale_dates(df['Sale Date'])
+    df['Sale Price'] = pd.to_numeric(df['Sale Price'].astype(str).str.replace(
+        r'[\$,\s]', '', regex=True), errors='coerce')
+    df['Square Ft'] = pd.to_numeric(df['Square Ft'], errors='coerce')
+    df['year_blt'] = pd.to_numeric(df['year_blt'], errors='coerce')
+
+    df = df[(df['Qualified Sales'] == 'Qualified') &
+            (df['Sale Price'] > 1000) &
+            (df['Square Ft'] > 75) &
+            df['sale_date'].notna() &
+            df['year_blt'].notna()].copy()
+
+    df['price_sf'] = df['Sale Price'] / df['Square Ft']
+    df['sale_id'] = sales_data.sale_ids(df['Address'], df['sale_date'], df['Sale Price'])
+    return df
+
+
+def lookup_geocodes(df, cache, backend=None, workers=8):
+    # lat / long from the geocode cache; addresses it doesn't know go to the
+    # backend if there is one, otherwise they stay unresolved
+    if backend is None:
+        backend = geocoder.CacheOnlyBackend()
+    geocoded, stats = geocoder.geocode_addresses(
+        df['full_address'].tolist(), backend, cache, workers=workers)
+    df['lat'] = geocoded['lat'].to_numpy(dtype=float)
+    df['long'] = geocoded['long'].to_numpy(dtype=float)
+    return df, stats
+
+
+def to_sales_columns(df):
+    # cleaned export rows -> the compact columns the dashboard loads.
+    # sales_data.write_columns refuses values that don't fit the stored dtypes
+    return pd.DataFrame({
+        'Square Ft': df['Square Ft'].astype('int32'),
+        'year_sale': df['sale_date'].dt.year.astype('int16'),
+        'year_blt': df['year_blt'].astype('int16'),
+        'price_sf': df['price_sf'].astype('float32'),
+        'Sale Price': df['Sale Price'].round().astype('int64'),
+        'GEOID': pd.Categorical(df['GEOID'].astype('int64')),
+        'Sub_geo': pd.Categorical(df['Sub_geo']),
+        'month_idx': sales_data.month_index(
+            df['sale_date'].dt.year, df['sale_date'].dt.month).astype('int16'),
+        'lat': df['lat'].astype('float32'),
+        'long': df['long'].astype('float32'),
+        'sale_id': df['sale_id'].to_numpy(dtype=np.uint64),
+    }).reset_index(drop=True)
+
+
+def load_sale_index(partitions_dir=sales_data.PARTITIONS_DIR,
+                    base_csv=sales_data.SALES_CSV):
+    # the saved index while it was built on the current base csv; after a
+    # new csv (or on the first run) it is rebuilt from the csv's unique_IDs
+    # plus every batch
+    path = os.path.join(partitions_dir, SALE_INDEX)
+    base = sales_data.source_stamp(base_csv)['sha256']
+    if os.path.exists(path) and sales_data.read_catalog(partitions_dir).get('base') == base:
+        return np.load(path), base
+
+    ids = [sales_data.csv_sale_ids(base_csv)]
+    for partition in sales_data.read_catalog(partitions_dir)['partitions']:
+        ids.append(np.load(os.path.join(
+            partitions_dir, partition['name'], 'sale_id.npy')))
+    return np.unique(np.concatenate(ids)), base
+
+
+def is_known(index, ids):
+    pos = np.searchsorted(index, ids)
+    return (pos < len(index)) & (index[np.minimum(pos, len(index) - 1)] == ids)
+
+
+def write_partition(df, sources, partitions_dir=sales_data.PARTITIONS_DIR):
+    # new batch directory, then the sale index, then the catalog; the
+    # dashboard only sees the batch once the catalog names it
+    catalog = sales_data.read_catalog(partitions_dir)
+    version = catalog['version'] + 1
+    name = f'part-{version:05d}'
+    out_dir = os.path.join(partitions_dir, name)
+
+    # one (county, sale year) segment per partition the batch adds to
+    keys = sales_data.write_partitioned(df, out_dir, {'sources': sources})
+    np.save(os.path.join(out_dir, 'sale_id.npy'), df['sale_id'].to_numpy())
+
+    catalog['version'] = version
+    catalog['partitions'].append({
+        'name': name,
+        'rows': len(df),
+        'segments': keys,
+        'sources': sources,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    })
+    for key in keys:
+        catalog['partition_versions'][key] = version
+
+    return catalog, keys
+
+
+def save_sale_index(index, partitions_dir=sales_data.PARTITIONS_DIR):
+    tmp = os.path.join(partitions_dir, 'sale_ids.tmp.npy')
+    np.save(tmp, index)
+    os.replace(tmp, os.path.join(partitions_dir, SALE_INDEX))
+
+
+def ingest(paths, cache, backend=None, partitions_dir=sales_data.PARTITIONS_DIR,
+           workers=8, dry_run=False, tracts=None, rejects_path=INGEST_REJECTS,
+           county='Forsyth'):
+    # `paths` are exports of one county's sales
+    os.makedirs(partitions_dir, exist_ok=True)
+    tracts = tracts or tract_assign.TractIndex()
+    index, base = load_sale_index(partitions_dir)
+
+    new_frames = []
+    for path in paths:
+        raw = read_export(path)
+        cleaned = clean_export(raw, county)
+
+        # drop sales we already have, including repeats within this run
+        fresh = cleaned[~is_known(index, cleaned['sale_id'].to_numpy())]
+        fresh = fresh[~fresh['sale_id'].duplicated()]
+
+        geocoded, stats = lookup_geocodes(fresh, cache, backend, workers)
+        in_tracts, rejects = tracts.assign(geocoded)
+        reasons = rejects['reject_reason'].value_counts()
+        if not dry_run:
+            tract_assign.quarantine(rejects, rejects_path, key='sale_id')
+
+        print(f'{os.path.basename(path)}: {len(raw):,} rows, {len(cleaned):,} qualified, '
+              f'{len(cleaned) - len(fresh):,} already loaded, '
+              f"{reasons.get('invalid_coordinates', 0):,} not geocoded, "
+              f"{reasons.get('outside_tracts', 0) + reasons.get('no_sub_geo', 0):,} outside the tracts, "
+              f"{reasons.get('unknown_county', 0):,} in counties not served, "
+              f'{len(in_tracts):,} new')
+
+        if len(in_tracts):
+            new_frames.append(to_sales_columns(in_tracts))
+            index = np.union1d(index, in_tracts['sale_id'].to_numpy(dtype=np.uint64))
+
+    if not new_frames or dry_run:
+        return None
+
+    new = sales_data.concat_sales(new_frames)
+    catalog, keys = write_partition(
+        new, [os.path.basename(p) for p in paths], partitions_dir)
+    save_sale_index(index, partitions_dir)
+    catalog['base'] = base
+    sales_data.write_json(catalog, os.path.join(partitions_dir, 'catalog.json'))
+    print(f"appended {len(new):,} sales as {catalog['partitions'][-1]['name']}; "
+          f'cached results for {", ".join(keys)} will be recomputed')
+    return catalog
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Append new county sales exports to the dashboard dataset.')
+    parser.add_argument('exports', nargs='+', help='.xlsx or .csv exports (globs ok)')
+    parser.add_argument('--county', choices=list(geocoder.ADDRESS_SUFFIXES), default='Forsyth',
+                        help='county the exports are from, for geocoding their addresses')
+    parser.add_argument('--backend', choices=list(geocoder.BACKENDS) + ['cache'],
+                        default='cache',
+                        help="geocoder for addresses missing from the cache; 'cache' never goes online")
+    parser.add_argument('--geocode-cache', default=geocoder.GEOCODE_CACHE)
+    parser.add_argument('--partitions', default=sales_data.PARTITIONS_DIR)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rejects', default=INGEST_REJECTS,
+                        help='csv that sales without a tract are appended to')
+    parser.add_argument('--tracts', nargs='+',
+                        default=list(tract_geometry.COUNTY_TRACTS.values()),
+                        help='tract files to assign sales to, every county by default')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--result-cache', default=result_cache.RESULT_CACHE,
+                        help='shared result cache to warm up once a batch lands')
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in args.exports for p in glob.glob(pattern))
+    backend = None if args.backend == 'cache' else geocoder.BACKENDS[args.backend]()
+    cache = geocoder.AddressCache(args.geocode_cache)
+
+    start = time.perf_counter()
+    try:
+        catalog = ingest(paths, cache, backend, args.partitions, args.workers, args.dry_run,
+                         tract_assign.TractIndex(args.tracts), args.rejects, args.county)
+    finally:
+        cache.close()
+        if hasattr(backend, 'close'):
+            backend.close()
+
+    # render the states over the new batch before visitors ask for them
+    if catalog is not None:
+        process = warmup.start(args.result_cache)
+        if process is not None:
+            print(f'warm-up started in the background (pid {process.pid}), '
+                  f'report in {warmup.WARMUP_LOG}')
+    print(f'done in {time.perf_counter() - start:.1f}s')
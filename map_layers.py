@@ -0,0 +1,108 @@
+import numpy as np
+import pydeck as pdk
+
+# colors to be used in the maps, lightest to darkest blue
+CUSTOM_COLORS = ['#97a3ab', '#667883', '#37505d', '#022b3a']
+
+# the above hex list as RGB values
+CUSTOM_COLORS = [tuple(int(h.lstrip('#')[i:i+2], 16) for i in (0, 2, 4))
+                 for h in CUSTOM_COLORS]
+
+TOOLTIP_STYLE = {"background": "rgba(2,43,58,0.7)",
+                 "border": "1px solid white",
+                 "color": "white",
+                 "font-family": "Helvetica",
+                 "text-align": "center"
+                 }
+
+# the 2D tract map also shows the median price; 3D & hexes show price / SF
+# and sales only
+TOOLTIP_2D = "Median price per SF: <b>{price_sf_formatted}</b><hr style='margin: 10px auto; opacity:0.5; border-top: 2px solid white; width:70%'>\
+                    Median price: <b>{price_formatted}</b><br>\
+                    Total sales: <b>{total_sales}</b>"
+TOOLTIP_3D = "Median price per SF: <b>{price_sf_formatted}</b><br>Total sales: <b>{total_sales}</b>"
+
+
+def price_breaks(df, n_classes=len(CUSTOM_COLORS)):
+    # color class edges for one county: equal-count quantiles of its
+    # (tract, sale year) median price / SF over every year. fixed per county &
+    # data version, so a tract keeps its shade across filters & both layers
+    medians = df.groupby(['GEOID', 'year_sale'], observed=True)['price_sf'].median()
+    if not len(medians):
+        return np.array([])
+    return np.quantile(medians.to_numpy(), np.arange(1, n_classes) / n_classes)
+
+
+def color_classes(values, breaks):
+    # index into CUSTOM_COLORS for each value
+    return np.searchsorted(breaks, np.asarray(values, dtype=np.float64), side='right')
+
+
+def layer_table(df, breaks):
+    # the attribute columns every map layer reads: color, elevation count and
+    # the tooltip strings. `df` is a tract_table() or hex_bins() frame
+    table = df.copy()
+    table['price_sf_formatted'] = [f'${v:.0f}' for v in table['price_sf'].tolist()]
+    if 'Sale Price' in table:
+        table['price_formatted'] = [f'${v:,.0f}' for v in table['Sale Price'].tolist()]
+    table['total_sales'] = [f'{v:,}' for v in table['count'].tolist()]
+    table['choro_color'] = [CUSTOM_COLORS[i]
+                            for i in color_classes(table['price_sf'], breaks).tolist()]
+    return table
+
+
+def map_deck(records, geometry, view, map_style, center, zoom):
+    # one pydeck map for either layer ('tracts' GeoJSON features or 'hexes'
+    # polygons) in either view; 3D tilts the camera & extrudes by sale count
+    three_d = view == '3D'
+    initial_view_state = pdk.ViewState(
+        latitude=center[0] + (0.1 if three_d else 0),
+        longitude=center[1],
+        zoom=zoom,
+        max_zoom=15,
+        min_zoom=8,
+        pitch=45 if three_d else 0,
+        bearing=0,
+        height=565
+    )
+
+    if geometry == 'tracts':
+        layer = pdk.Layer(
+            "GeoJsonLayer",
+            records,
+            pickable=True,
+            autoHighlight=True,
+            highlight_color=[255, 255, 255, 90 if three_d else 80],
+            opacity=0.5,
+            stroked=not three_d,
+            filled=True,
+            wireframe=False,
+            extruded=three_d,
+            get_elevation='count * 50',
+            get_fill_color='choro_color',
+            get_line_color='choro_color' if three_d else [0, 0, 0, 255],
+            line_width_min_pixels=1
+        )
+    else:
+        layer = pdk.Layer(
+            "PolygonLayer",
+            records,
+            get_polygon='polygon',
+            pickable=True,
+            autoHighlight=True,
+            highlight_color=[255, 255, 255, 80],
+            opacity=0.6,
+            stroked=False,
+            filled=True,
+            extruded=three_d,
+            get_elevation='count * 50',
+            get_fill_color='choro_color'
+        )
+
+    html = TOOLTIP_2D if geometry == 'tracts' and not three_d else TOOLTIP_3D
+    return pdk.Deck(
+        layers=layer,
+        initial_view_state=initial_view_state,
+        map_provider='mapbox',
+        map_style=map_style,
+        tooltip={"html": html, "style": TOOLTIP_STYLE})
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# rendered results shared by every dashboard process on the host. set
+# RESULT_CACHE to another path, or to '' to turn the cache off
+RESULT_CACHE = os.environ.get('RESULT_CACHE', 'result_cache.sqlite')
+
+# total size of the stored results; least recently used go first past it
+RESULT_CACHE_BYTES = 256 * 2 ** 20
+
+# bump when what gets stored changes shape, so old entries stop matching
+RESULT_FORMAT = 3
+
+
+def state_key(kind, state, data_version):
+    # canonical hash of one result: what it is, the sidebar state it was
+    # rendered for (sorted keys, tuples as lists) and the version of the data
+    # behind it (see dash_views.data_versions)
+    payload = json.dumps([RESULT_FORMAT, kind, data_version, state],
+                         sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    # zlib-compressed JSON results in SQLite, keyed by state_key(). deck JSON
+    # is mostly repeated coordinates and shrinks ~5x. the version of the
+    # sale years & tracts a result covers is part of its key, so a new
+    # dataset only stops the results whose data changed from matching; those
+    # are never read again and age out least-recently-used first. WAL mode
+    # lets processes read while another writes
+
+    def __init__(self, path=RESULT_CACHE, max_bytes=RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                used REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+
+    def get(self, kind, state, version):
+        # the stored JSON value, or None
+        key = state_key(kind, state, version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE results SET used = ? WHERE key = ?", (time.time(), key))
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, kind, state, value, version):
+        value = zlib.compress(json.dumps(value, separators=(',', ':')).encode())
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (state_key(kind, state, version), version, value,
+                 len(value), time.time()))
+            self._evict()
+            self._db.execute("COMMIT")
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # oldest first until back under the limit
+        drop = []
+        for key, size in self._db.execute(
+                "SELECT key, size FROM results ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            drop.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", drop)
+
+    def stats(self):
+        with self._lock:
+            count, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        return {'entries': count, 'bytes': size}
+
+    def close(self):
+        self._db.close()
+
+
+class CachedDeck:
+    # stands in for a pydeck.Deck in st.pydeck_chart, which only reads the
+    # deck's JSON and its tooltip
+
+    def __init__(self, spec, tooltip):
+        self.spec = spec
+        self._tooltip = tooltip
+
+    def to_json(self):
+        return self.spec
+
+
+def deck_result(deck):
+    return {'spec': deck.to_json(), 'tooltip': deck._tooltip}
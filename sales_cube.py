@@ -0,0 +1,305 @@
+import numpy as np
+import pandas as pd
+
+from sales_sketch import SKETCH_SIZE, QuantileSketch
+
+# construction vintage buckets offered in the sidebar, inclusive year ranges
+VINTAGE_BUCKETS = {
+    '<2000': [0, 1999],
+    '2000-2010': [2000, 2010],
+    '2011-2023': [2011, 2050]
+}
+
+# values kept per cube cell, in the order the dashboard reports them
+CUBE_MEASURES = ['price_sf', 'Sale Price', 'year_blt', 'Square Ft']
+
+# quantile engines: exact selection over the cube, or per-cell sketches
+# (sales_sketch.py) whose error is bounded but whose cost doesn't grow with rows
+ENGINES = ('exact', 'sketch')
+
+
+def vintage_bucket(year_blt):
+    # index into VINTAGE_BUCKETS for every construction year
+    lowers = np.array([b[0] for b in VINTAGE_BUCKETS.values()])
+    return np.searchsorted(lowers, year_blt, side='right') - 1
+
+
+class CellStore:
+    # rows grouped into integer cells, with exact quantiles over any set of
+    # cells.
+    #
+    # for every measure the rows are stored sorted by (cell, value), with the
+    # value replaced by its rank in the whole column. a cell is then a run of
+    # consecutive keys `cell * n_rows + rank`, and "how many values in these
+    # cells are <= the r-th smallest overall" is one vectorized searchsorted
+    # over the selected cells. exact quantiles come from bisecting on r, so a
+    # query costs O(cells * log(rows)^2) no matter how many rows it covers.
+    #
+    # with a `sketch_size` only QuantileSketch summaries are built and the
+    # exact keys are skipped, so quantiles come from the sketches alone
+
+    def __init__(self, cell, n_cells, columns, sketch_size=None):
+        self.n_rows = len(cell)
+        self.n_cells = n_cells
+        self.counts = np.bincount(cell, minlength=n_cells)
+        self.offsets = np.concatenate([[0], np.cumsum(self.counts)])
+        if sketch_size is not None:
+            self.engine = QuantileSketch(cell, self.counts, columns, sketch_size)
+            return
+
+        self.sorted_values = {}
+        self.keys = {}
+        for measure, values in columns.items():
+            order = np.argsort(values, kind='stable')
+            rank = np.empty(self.n_rows, dtype=np.int64)
+            rank[order] = np.arange(self.n_rows)
+
+            self.sorted_values[measure] = values[order]
+            self.keys[measure] = np.sort(cell.astype(np.int64) * self.n_rows + rank)
+
+        self.engine = self
+
+    def count(self, cell_groups):
+        return np.array([self.counts[c].sum() for c in cell_groups])
+
+    def medians(self, measure, cell_groups):
+        return self.engine.quantiles(measure, cell_groups, [0.5])[:, 0]
+
+    def quantiles(self, measure, cell_groups, qs):
+        # exact quantiles of `measure` over each group of cells, interpolated
+        # between neighbouring values the way pandas does. returns an array
+        # of shape (groups, len(qs)), NaN for empty groups
+        cells = np.concatenate(cell_groups) if len(cell_groups) \
+            else np.array([], dtype=np.int64)
+        query = np.repeat(np.arange(len(cell_groups)),
+                          [len(c) for c in cell_groups])
+        n = np.bincount(query, weights=self.counts[cells],
+                        minlength=len(cell_groups)).astype(np.int64)
+
+        # the two values around every requested position, selected together
+        position = (n[:, None] - 1) * np.asarray(qs, dtype=np.float64)[None, :]
+        below = np.floor(position).astype(np.int64)
+        above = np.ceil(position).astype(np.int64)
+        n_queries = len(cell_groups) * len(qs) * 2
+        query_ids = np.arange(n_queries).reshape(len(cell_groups), len(qs) * 2)
+
+        cell_query = query_ids[query]
+        values = self._kth(
+            measure,
+            np.repeat(cells, len(qs) * 2),
+            cell_query.ravel(),
+            np.stack([below, above], axis=2).reshape(-1)
+        ).reshape(len(cell_groups), len(qs), 2)
+
+        result = values[..., 0] + (position - below) * (values[..., 1] - values[..., 0])
+        return np.where(n[:, None] > 0, result, np.nan)
+
+    def _kth(self, measure, cells, query, k):
+        # k-th smallest value (0-based) within each query's cells, by
+        # bisecting on the global rank
+        keys = self.keys[measure]
+        n_queries = len(k)
+        base = cells.astype(np.int64) * self.n_rows
+        start = self.offsets[cells]
+
+        lo = np.zeros(n_queries, dtype=np.int64)
+        hi = np.full(n_queries, max(self.n_rows - 1, 0), dtype=np.int64)
+        while (lo < hi).any():
+            mid = (lo + hi) // 2
+            at_or_below = np.searchsorted(
+                keys, base + mid[query], side='right') - start
+            counts = np.bincount(query, weights=at_or_below,
+                                 minlength=n_queries)
+            found = counts >= k + 1
+            active = lo < hi
+            hi = np.where(active & found, mid, hi)
+            lo = np.where(active & ~found, mid + 1, lo)
+
+        return self.sorted_values[measure][lo].astype(np.float64)
+
+
+class SalesCube(CellStore):
+    # sales pre-aggregated into (GEOID, year_sale, vintage bucket) cells.
+    # with engine='sketch' every quantile is answered from QuantileSketch
+    # summaries of the same cells instead of exact selection, and the exact
+    # structure is never built
+
+    def __init__(self, df, engine='exact', sketch_size=SKETCH_SIZE):
+        if engine not in ENGINES:
+            raise ValueError(f'engine must be one of {ENGINES}, got {engine!r}')
+
+        # GEOID is dictionary-encoded; its codes are the tract axis as-is.
+        # tracts without sales here just leave their cells empty
+        geoid = pd.Categorical(df['GEOID'])
+        self.geoids = np.asarray(geoid.categories, dtype=np.int64)
+        self.years = np.sort(df['year_sale'].unique())
+        self.vintages = list(VINTAGE_BUCKETS)
+
+        g = geoid.codes.astype(np.int64)
+
+        # each tract belongs to exactly one region
+        self.tract_sub_geo = pd.Series(np.asarray(df['Sub_geo']),
+                                       index=self.geoids[g]).groupby(level=0).first()
+
+        y = np.searchsorted(self.years, df['year_sale'].to_numpy())
+        v = vintage_bucket(df['year_blt'].to_numpy())
+        cell = (g * len(self.years) + y) * len(self.vintages) + v
+
+        super().__init__(
+            cell,
+            len(self.geoids) * len(self.years) * len(self.vintages),
+            {measure: df[measure].to_numpy() for measure in CUBE_MEASURES},
+            sketch_size if engine == 'sketch' else None)
+        self.engine_name = engine
+
+    def cells(self, years, year_built, geoids=None):
+        # cell ids for a sale-year range, a vintage bucket range and
+        # (optionally) a subset of tracts
+        g = np.arange(len(self.geoids)) if geoids is None \
+            else np.flatnonzero(np.isin(self.geoids, list(geoids)))
+        y = np.flatnonzero((self.years >= years[0]) & (self.years <= years[1]))
+        v = np.arange(self.vintages.index(year_built[0]),
+                      self.vintages.index(year_built[1]) + 1)
+
+        return ((g[:, None, None] * len(self.years) + y[None, :, None])
+                * len(self.vintages) + v[None, None, :]).reshape(len(g), len(y) * len(v))
+
+    def geoids_in(self, sub_geos):
+        return self.tract_sub_geo.index[self.tract_sub_geo.isin(sub_geos)]
+
+    def tract_table(self, years, year_built, geoids=None):
+        # per-tract medians & counts, the grouped frame behind the map
+        cells = self.cells(years, year_built, geoids)
+        groups = list(cells)
+        count = self.count(groups)
+        keep = count > 0
+        groups = [c for c, k in zip(groups, keep) if k]
+        tract_ids = self.geoids if geoids is None \
+            else self.geoids[np.isin(self.geoids, list(geoids))]
+
+        table = {'GEOID': tract_ids[keep]}
+        for measure in ['price_sf', 'Sale Price', 'year_blt']:
+            table[measure] = self.medians(measure, groups)
+        table['count'] = count[keep]
+
+        return pd.DataFrame(table)
+
+    def kpis(self, years, year_built, geoids=None):
+        # headline numbers for the KPI row: medians, their p25 / p75 under
+        # 'iqr', and the first-to-last year change in median price / SF
+        # (None when a single year is selected)
+        return self.group_kpis(years, year_built, [geoids])[0]
+
+    def group_kpis(self, years, year_built, geoid_groups):
+        # kpis() of several groups of tracts side by side. every measure is
+        # one quantile query over all the groups' cells, so the cost follows
+        # the cells selected rather than the number of groups
+        rows = [np.arange(len(self.geoids)) if geoids is None
+                else np.flatnonzero(np.isin(self.geoids, list(geoids)))
+                for geoids in geoid_groups]
+        all_cells = self.cells(years, year_built)
+        selected = [all_cells[r].ravel() for r in rows]
+        kpis = [{'total_sales': int(self.counts[cells].sum()), 'iqr': {}} for cells in selected]
+        for measure in CUBE_MEASURES:
+            quantiles = self.engine.quantiles(measure, selected, [0.25, 0.5, 0.75])
+            for kpi, (p25, p50, p75) in zip(kpis, quantiles):
+                kpi[measure] = p50
+                kpi['iqr'][measure] = (p25, p75)
+
+        for kpi in kpis:
+            kpi['yoy_delta'] = None
+        if years[0] != years[1]:
+            first = self.cells((years[0], years[0]), year_built)
+            last = self.cells((years[1], years[1]), year_built)
+            medians = self.medians('price_sf', [first[r].ravel() for r in rows] +
+                                   [last[r].ravel() for r in rows])
+            for kpi, start, end in zip(kpis, medians[:len(rows)], medians[len(rows):]):
+                kpi['yoy_delta'] = (end - start) / start
+
+        return kpis
+
+
+class MonthlySeries(CellStore):
+    # price / SF by (Sub_geo, vintage bucket, month) for the trend chart.
+    # months are consecutive integers (sales_data.month_index), so a filter
+    # state's series is one quantile query per month over at most
+    # regions x vintages cells, and months without sales simply come back
+    # empty. the cell store doubles as the order-statistic structure for
+    # rolling medians: a w-month window is w months' worth of cells
+
+    def __init__(self, df):
+        self.sub_geos = list(df['Sub_geo'].cat.categories)
+        self.vintages = list(VINTAGE_BUCKETS)
+        month_idx = df['month_idx'].to_numpy()
+        self.months = np.arange(month_idx.min(), month_idx.max() + 1)
+
+        s = df['Sub_geo'].cat.codes.to_numpy().astype(np.int64)
+        v = vintage_bucket(df['year_blt'].to_numpy())
+        m = month_idx - self.months[0]
+        cell = (s * len(self.vintages) + v) * len(self.months) + m
+
+        super().__init__(
+            cell,
+            len(self.sub_geos) * len(self.vintages) * len(self.months),
+            {'price_sf': df['price_sf'].to_numpy()})
+
+    def _window_cells(self, s, v, window):
+        # cells of every month (one row each) over regions `s` & vintages
+        # `v`, and the months they're for. with window > 1 each row also
+        # holds the trailing window - 1 months' cells
+        m = np.arange(len(self.months))
+        cells = ((s[None, :, None] * len(self.vintages) + v[None, None, :])
+                 * len(self.months) + m[:, None, None]).reshape(len(m), -1)
+        months = self.months
+
+        if window > 1:
+            # every window is just more cells in the same quantile query
+            n_windows = max(len(m) - window + 1, 0)
+            cells = np.concatenate(
+                [cells[i:i + n_windows] for i in range(window)], axis=1)
+            months = self.months[window - 1:]
+
+        return cells, months
+
+    def series(self, year_built, sub_geos=None, window=1):
+        # median price / SF and sale count per month, months with sales only.
+        # with window > 1 each month instead pools the sales of the trailing
+        # `window` months (itself included), i.e. a rolling median; months
+        # without a full window behind them are left out
+        s = np.arange(len(self.sub_geos)) if sub_geos is None \
+            else np.flatnonzero(np.isin(self.sub_geos, list(sub_geos)))
+        v = np.arange(self.vintages.index(year_built[0]),
+                      self.vintages.index(year_built[1]) + 1)
+        cells, months = self._window_cells(s, v, window)
+
+        groups = list(cells)
+        count = self.count(groups)
+        keep = count > 0
+
+        return pd.DataFrame({
+            'month_idx': months[keep],
+            'price_sf': self.medians('price_sf', [g for g, k in zip(groups, keep) if k]),
+            'count': count[keep],
+        })
+
+    def compare(self, year_built, sub_geos, window=1):
+        # series() of each region in `sub_geos` on its own, in long format
+        # with a 'Sub_geo' column. all (region, month) groups go into one
+        # quantile query instead of one series() per region
+        v = np.arange(self.vintages.index(year_built[0]),
+                      self.vintages.index(year_built[1]) + 1)
+        per_region = [self._window_cells(np.array([self.sub_geos.index(r)]), v, window)
+                      for r in sub_geos]
+        months = per_region[0][1] if per_region else self.months[:0]
+        cells = np.concatenate([c for c, _ in per_region]) if per_region \
+            else np.empty((0, len(v) * window), dtype=np.int64)
+
+        count = self.counts[cells].sum(axis=1)
+        keep = count > 0
+
+        return pd.DataFrame({
+            'Sub_geo': np.repeat(list(sub_geos), len(months))[keep],
+            'month_idx': np.tile(months, len(sub_geos))[keep],
+            'price_sf': self.medians('price_sf', list(cells[keep])),
+            'count': count[keep],
+        })
@@ -0,0 +1,668 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+import geocoder
+
+SALES_CSV = 'Geocoded_Final_Joined4.csv'
+
+# typed snapshot of the sales csv, one memory-mappable .npy file per column.
+# a symlink to the snapshot of the current csv, data_snapshot-<digest>/
+SNAPSHOT_DIR = 'data_snapshot'
+
+# the compact core table: columns stored in the snapshot and their on-disk
+# dtypes, ~28 bytes per sale. price_sf only needs 7 significant digits,
+# float32 lat / long are good to ~0.5 m (NaN where a sale isn't geocoded),
+# and months since year 0 fit an int16 until the year 2730
+SNAPSHOT_COLUMNS = {
+    'Square Ft': 'int32',
+    'year_sale': 'int16',
+    'year_blt': 'int16',
+    'price_sf': 'float32',
+    'Sale Price': 'int32',
+    'GEOID': 'int16',
+    'Sub_geo': 'int8',
+    'month_idx': 'int16',
+    'lat': 'float32',
+    'long': 'float32',
+}
+
+# dictionary-encoded columns: categoricals in memory, stored as codes (the
+# dtypes above) with their labels in the manifest
+CATEGORICAL_COLUMNS = ('GEOID', 'Sub_geo')
+
+# the snapshot is split into one directory of columns per (county, sale
+# year), data_snapshot/<county>/<year>/, with a top-level manifest listing them
+# and a content digest of every tract in each, and the hashed sale ids of the
+# whole csv in data_snapshot/sale_ids.npy
+SNAPSHOT_VERSION = 7
+
+# sales appended after the base csv, one directory per ingest batch laid out
+# the same way, listed in catalog.json (see ingest.py)
+PARTITIONS_DIR = 'sales_partitions'
+
+# geocoded addresses (full_address, lat, long) the snapshot takes sale
+# coordinates from, on top of the geocode cache (geocoder.py), by county.
+# full addresses end in the county's geocoder.ADDRESS_SUFFIXES entry
+GEOCODED_ADDRESSES = {
+    'Forsyth': ['NewSales/Forsyth_2023_geocoded.csv'],
+}
+
+# counties served, by name -> state + county FIPS (the first five digits of
+# a tract GEOID). a new county also needs its tract file in
+# tract_geometry.COUNTY_TRACTS, its tracts in SUB_GEO_LOOKUP and its address
+# suffix in geocoder.ADDRESS_SUFFIXES
+COUNTIES = {
+    'Forsyth': 13117,
+}
+
+# GEOID -> Sub_geo grouping for every tract we serve
+SUB_GEO_LOOKUP = 'Geography/sub_geo_lookup.csv'
+
+# resident partitions kept by SalesStore before the least recently used are
+# dropped. the whole Forsyth history is ~2 MB
+PARTITION_CACHE_BYTES = 512 * 2 ** 20
+
+
+def month_index(year, month):
+    # months since year 0, so consecutive months are consecutive integers
+    return year * 12 + (month - 1)
+
+
+def parse_sale_dates(values):
+    # exports mix 3/6/2023 and 2/27/23
+    values = pd.Series(values).astype(str).str.split(' ').str[0]
+    dates = pd.to_datetime(values, format='%m/%d/%Y', errors='coerce')
+    dates = dates.where(dates.dt.year > 1900)
+    iso = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    short = pd.to_datetime(values, format='%m/%d/%y', errors='coerce')
+    return dates.fillna(iso).fillna(short)
+
+
+def sale_ids(address, sale_date, price):
+    # the old unique_ID ('Address-Sale Date-price') with the address
+    # normalized, the date in ISO form and the price as a whole number, hashed
+    # to 64 bits so the index stays a flat sorted array
+    keys = (pd.Series(address).map(geocoder.normalize_address).to_numpy() + '|'
+            + pd.Series(sale_date).dt.strftime('%Y-%m-%d').to_numpy() + '|'
+            + pd.Series(price).round().astype('int64').astype(str).to_numpy())
+    return np.array([int.from_bytes(hashlib.blake2b(k.encode(), digest_size=8).digest(), 'little')
+                     for k in keys], dtype=np.uint64)
+
+
+def csv_sale_ids(path=SALES_CSV):
+    # sorted sale ids of every sale in the csv, from its unique_IDs
+    base = pd.read_csv(path, usecols=['unique_ID'], keep_default_na=False)
+    parts = base['unique_ID'].str.rsplit('-', n=2, expand=True)
+    return np.unique(sale_ids(parts[0], parse_sale_dates(parts[1]),
+                              pd.to_numeric(parts[2])))
+
+
+def read_sales_csv(path=SALES_CSV):
+    # load the data
+    df = pd.read_csv(path, thousands=',', keep_default_na=False)
+
+    # prices come through as strings like "$2,400,000 "
+    df['Sale Price'] = pd.to_numeric(df['Sale Price'].str.replace(
+        r'[\$,\s]', '', regex=True)).astype('int64')
+
+    # the csv has no coordinates; look the sales up by the address in unique_ID
+    suffix = pd.Series(county_names(df['GEOID'])).map(geocoder.ADDRESS_SUFFIXES)
+    address = df['unique_ID'].str.rsplit('-', n=2).str[0] + suffix
+    lat, long = lookup_coordinates(address)
+
+    # unique_ID, year / month and 'year-month' are dropped: sales are
+    # counted by rows, and month_idx carries the month
+    return pd.DataFrame({
+        'Square Ft': df['Square Ft'].astype('int32'),
+        'year_sale': df['year_sale'].astype('int16'),
+        'year_blt': df['year_blt'].astype('int16'),
+        'price_sf': df['price_sf'].astype('float32'),
+        'Sale Price': df['Sale Price'].astype('int32'),
+        'GEOID': pd.Categorical(df['GEOID'].astype('int64')),
+        'Sub_geo': pd.Categorical(df['Sub_geo']),
+        'month_idx': month_index(df['year'], df['month']).astype('int16'),
+        'lat': lat.astype('float32'),
+        'long': long.astype('float32'),
+    })
+
+
+def geocoded_address_files():
+    # GEOCODED_ADDRESSES of every county
+    return [path for paths in GEOCODED_ADDRESSES.values() for path in paths]
+
+
+def lookup_coordinates(full_addresses, sources=None,
+                       cache_path=geocoder.GEOCODE_CACHE):
+    # (lat, long) arrays for the addresses, NaN where neither the geocoded
+    # csvs (every county's by default) nor the geocode cache know them
+    known = {}
+    for path in geocoded_address_files() if sources is None else sources:
+        if os.path.exists(path):
+            geocoded = pd.read_csv(path)
+            lat = pd.to_numeric(geocoded['lat'], errors='coerce')
+            long = pd.to_numeric(geocoded['long'], errors='coerce')
+            ok = lat.notna() & long.notna()
+            known.update(zip(geocoded.loc[ok, 'full_address'].map(geocoder.normalize_address),
+                             zip(lat[ok], long[ok])))
+    if os.path.exists(cache_path):
+        cache = geocoder.AddressCache(cache_path)
+        known.update(cache.coordinates())
+        cache.close()
+
+    coords = [known.get(geocoder.normalize_address(a), (np.nan, np.nan))
+              for a in full_addresses]
+    coords = np.array(coords, dtype=np.float64).reshape(-1, 2)
+    return coords[:, 0], coords[:, 1]
+
+
+def source_stamp(path):
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+
+
+def geocode_stamp(cache_path=geocoder.GEOCODE_CACHE):
+    # size & mtime of every file the snapshot takes coordinates from, so new
+    # geocodes make the snapshot stale like a changed csv does
+    stamp = {}
+    for path in [*geocoded_address_files(), cache_path]:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamp[path] = [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+
+def snapshot_digest(source, df):
+    # what the snapshot holds: the snapshot format, the csv's digest and the
+    # coordinates looked up for its sales
+    digest = hashlib.sha256(f"{SNAPSHOT_VERSION}.{source['sha256']}".encode())
+    for col in ('lat', 'long'):
+        digest.update(np.ascontiguousarray(df[col].to_numpy()).tobytes())
+    return digest.hexdigest()
+
+
+def snapshot_is_fresh(manifest, path):
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+    if manifest.get('geocodes') != geocode_stamp():
+        return False
+
+    source = manifest['source']
+    stat = os.stat(path)
+    if stat.st_size != source['size']:
+        return False
+    if stat.st_mtime_ns == source['mtime_ns']:
+        return True
+
+    # same size but touched (e.g. a fresh git checkout): compare contents
+    return source_stamp(path)['sha256'] == source['sha256']
+
+
+def write_columns(df, out_dir, manifest):
+    # one .npy per snapshot column plus a manifest.json. categorical columns
+    # are stored as codes with their labels in the manifest
+    os.makedirs(out_dir, exist_ok=True)
+
+    categories = {}
+    for col, dtype in SNAPSHOT_COLUMNS.items():
+        values = df[col]
+        if col in CATEGORICAL_COLUMNS:
+            values = pd.Categorical(values)
+            categories[col] = values.categories.tolist()
+            values = values.codes
+        values = np.asarray(values)
+
+        stored = values.astype(dtype, copy=False)
+        if stored.dtype.kind in 'iu' and not np.array_equal(stored, values):
+            raise ValueError(f'{col} does not fit in {dtype}')
+        np.save(os.path.join(out_dir, f'{col}.npy'), stored)
+
+    manifest = dict(manifest,
+                    version=SNAPSHOT_VERSION,
+                    rows=len(df),
+                    categories=categories)
+
+    # manifest goes last so a half-written directory never looks complete
+    write_json(manifest, os.path.join(out_dir, 'manifest.json'))
+
+
+def read_columns(in_dir):
+    with open(os.path.join(in_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    columns = {}
+    for col in SNAPSHOT_COLUMNS:
+        values = np.load(os.path.join(in_dir, f'{col}.npy'), mmap_mode='r')
+        if col in CATEGORICAL_COLUMNS:
+            values = pd.Categorical.from_codes(
+                values, categories=manifest['categories'][col])
+        columns[col] = values
+
+    return pd.DataFrame(columns, copy=False), manifest
+
+
+def write_json(obj, path):
+    # write-then-rename so readers never see a partial file
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+
+def county_sub_geos(county, path=SUB_GEO_LOOKUP):
+    # GEOID / Sub_geo rows of one county's tracts. the sidebar asks on every
+    # rerun, so the csv is only read again once its size or mtime changes.
+    # shared between callers; don't modify it
+    stat = os.stat(path)
+    return _read_county_sub_geos(county, path, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=16)
+def _read_county_sub_geos(county, path, size, mtime_ns):
+    lookup = pd.read_csv(path)
+    in_county = lookup['GEOID'] // 10 ** 6 == COUNTIES.get(county)
+    return lookup.loc[in_county, ['GEOID', 'Sub_geo']].reset_index(drop=True)
+
+
+def sub_geos(county):
+    # the Sub_geo groupings of one county
+    return sorted(county_sub_geos(county)['Sub_geo'].unique())
+
+
+def sub_geo_tracts(county, names):
+    # GEOIDs of the tracts in these Sub_geo groupings of one county
+    lookup = county_sub_geos(county)
+    return lookup.loc[lookup['Sub_geo'].isin(list(names)), 'GEOID'].tolist()
+
+
+def county_names(geoids):
+    # county name for every tract GEOID (state + county FIPS are its first
+    # five digits); counties missing from COUNTIES go by their FIPS code
+    names = {fips: name for name, fips in COUNTIES.items()}
+    fips = np.asarray(geoids, dtype=np.int64) // 10 ** 6
+    return pd.Series(fips).map(lambda f: names.get(f, str(f))).to_numpy()
+
+
+def partition_key(county, year):
+    return f'{county}/{int(year)}'
+
+
+def partition_rows(df):
+    # row positions of every (county, sale year) partition, by partition key
+    groups = df.groupby([county_names(df['GEOID']), df['year_sale'].to_numpy()]).indices
+    return {partition_key(county, year): rows for (county, year), rows in groups.items()}
+
+
+def tract_digests(df):
+    # content digest of every tract's sales, by GEOID (as a string). a new
+    # csv or batch only changes the digests of the tracts it touches
+    hashed = pd.util.hash_pandas_object(df[list(SNAPSHOT_COLUMNS)], index=False).to_numpy()
+    groups = df.groupby(np.asarray(df['GEOID'], dtype=np.int64)).indices
+    return {str(geoid): hashlib.sha256(hashed[rows].tobytes()).hexdigest()[:16]
+            for geoid, rows in groups.items()}
+
+
+def write_partitioned(df, out_dir, manifest):
+    # one column directory per (county, sale year) under
+    # out_dir/<county>/<year>/, then a manifest.json listing them with their
+    # row counts and tract digests. returns the partition keys written
+    partitions = partition_rows(df)
+    for key, rows in partitions.items():
+        county, year = key.split('/')
+        write_columns(df.iloc[rows], os.path.join(out_dir, key),
+                      {'county': county, 'year': int(year)})
+        if 'sale_id' in df:
+            # ingest batches keep their sale ids per partition, for SalesStore
+            # to drop the ones a later base csv already has
+            np.save(os.path.join(out_dir, key, 'sale_id.npy'),
+                    df['sale_id'].to_numpy()[rows])
+
+    write_json(dict(manifest, version=SNAPSHOT_VERSION,
+                    partitions={key: len(rows) for key, rows in partitions.items()},
+                    tracts={key: tract_digests(df.iloc[rows])
+                            for key, rows in partitions.items()}),
+               os.path.join(out_dir, 'manifest.json'))
+    return list(partitions)
+
+
+def write_snapshot(df, source_path=SALES_CSV, snapshot_dir=SNAPSHOT_DIR):
+    # every csv & set of coordinates gets its own directory,
+    # <snapshot_dir>-<digest>/, and snapshot_dir is a symlink swapped over to
+    # it in one rename. stores opened on the previous snapshot keep reading
+    # its files; it is deleted by the rebuild after this one. a directory
+    # that already holds the same data is reused as it is, never rewritten,
+    # as stores may have its columns mapped
+    base = snapshot_dir.rstrip('/')
+    source = source_stamp(source_path)
+    digest = snapshot_digest(source, df)
+    target = f'{base}-{digest[:12]}'
+    manifest = {'source': source, 'digest': digest, 'geocodes': geocode_stamp()}
+    if os.path.exists(os.path.join(target, 'manifest.json')):
+        with open(os.path.join(target, 'manifest.json')) as f:
+            write_json(dict(json.load(f), **manifest), os.path.join(target, 'manifest.json'))
+    else:
+        tmp = target + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, 'sale_ids.npy'), csv_sale_ids(source_path))
+        write_partitioned(df, tmp, manifest)
+        os.replace(tmp, target)
+
+    previous = os.path.realpath(base) if os.path.islink(base) else None
+    link = base + '.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(target), link)
+    if os.path.isdir(base) and not os.path.islink(base):
+        # a snapshot from before the versioned directories
+        shutil.rmtree(base)
+    os.replace(link, base)
+
+    if previous == os.path.realpath(target):
+        # same data as before: the snapshot before it may still be in use
+        return
+    keep = {os.path.realpath(target), previous}
+    for old in glob.glob(glob.escape(base) + '-*'):
+        if os.path.realpath(old) not in keep:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def fresh_manifest(path, snapshot_dir):
+    # the snapshot's manifest if it was built from the csv at `path` as it
+    # is now, else None
+    manifest_path = os.path.join(snapshot_dir, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    return manifest if snapshot_is_fresh(manifest, path) else None
+
+
+def load_snapshot(path=SALES_CSV, snapshot_dir=SNAPSHOT_DIR):
+    # manifest of the partitioned snapshot, (re)built from the csv when it is
+    # missing or stale. one process rebuilds at a time; the others wait and
+    # use its snapshot. on a read-only deploy the parsed csv is returned
+    # alongside (manifest is None then) and served from memory instead
+    manifest = fresh_manifest(path, snapshot_dir)
+    if manifest is not None:
+        return manifest, None
+
+    try:
+        lock = open(snapshot_dir.rstrip('/') + '.lock', 'w')
+    except OSError:
+        # read-only deploys just keep parsing the csv
+        return None, read_sales_csv(path)
+
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        # another process may have rebuilt it while this one waited
+        manifest = fresh_manifest(path, snapshot_dir)
+        if manifest is not None:
+            return manifest, None
+
+        df = read_sales_csv(path)
+        try:
+            write_snapshot(df, path, snapshot_dir)
+        except OSError:
+            return None, df
+
+    return fresh_manifest(path, snapshot_dir), None
+
+
+def data_stamp(catalog, path=SALES_CSV):
+    # cheap check for a new dataset, for every rerun: the catalog version and
+    # the size & mtime of the csv and of the geocodes it is joined with. a
+    # file touched without changing opens a store with the same data versions
+    # as before
+    stat = os.stat(path)
+    geocodes = ','.join(f'{size}.{mtime}' for size, mtime in geocode_stamp().values())
+    return f"{stat.st_size}.{stat.st_mtime_ns}.{geocodes}.{catalog['version']}"
+
+
+def read_catalog(partitions_dir=PARTITIONS_DIR):
+    # the appended ingest batches and a version number per (county, sale
+    # year) partition, bumped by ingest.py whenever a batch adds sales to it
+    path = os.path.join(partitions_dir, 'catalog.json')
+    if not os.path.exists(path):
+        return {'version': 0, 'partitions': [], 'partition_versions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def concat_sales(frames):
+    # stack sales frames, merging the categories of their categorical columns
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame({col: pd.Categorical([]) if col in CATEGORICAL_COLUMNS
+                             else np.array([], dtype=dtype)
+                             for col, dtype in SNAPSHOT_COLUMNS.items()})
+    if len(frames) == 1:
+        return frames[0]
+
+    df = pd.concat([f.drop(columns=list(CATEGORICAL_COLUMNS)) for f in frames],
+                   ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        df.insert(list(SNAPSHOT_COLUMNS).index(col), col,
+                  union_categoricals([pd.Categorical(f[col]) for f in frames]))
+    return df
+
+
+def batch_segment(segment_dir, base_ids):
+    # an ingest batch partition as SalesStore reads it: its directory, or
+    # (directory, rows to keep) when the base csv has some of its sales
+    # already, as a csv re-exported after an ingest does. None when it has
+    # all of them. batches written before they kept sale ids are read whole
+    ids_path = os.path.join(segment_dir, 'sale_id.npy')
+    if not len(base_ids) or not os.path.exists(ids_path):
+        return segment_dir
+    keep = np.flatnonzero(~np.isin(np.load(ids_path), base_ids))
+    if not len(keep):
+        return None
+    with open(os.path.join(segment_dir, 'manifest.json')) as f:
+        rows = json.load(f)['rows']
+    return segment_dir if len(keep) == rows else (segment_dir, keep)
+
+
+def read_segment(segment):
+    # one segment of a partition: a column directory, a (directory, rows)
+    # pair from batch_segment, or a frame when the snapshot couldn't be written
+    if isinstance(segment, str):
+        return read_columns(segment)[0]
+    if isinstance(segment, tuple):
+        return read_columns(segment[0])[0].iloc[segment[1]].reset_index(drop=True)
+    return segment
+
+
+class SalesStore:
+    # every (county, sale year) partition of the base snapshot and the ingest
+    # batches, loaded on first use. loaded partitions stay resident,
+    # least-recently-used first out once they pass `max_bytes`, so memory
+    # follows what the sessions are looking at rather than how many counties
+    # the catalog lists. safe to share between sessions
+
+    def __init__(self, path=SALES_CSV, snapshot_dir=SNAPSHOT_DIR,
+                 partitions_dir=PARTITIONS_DIR, max_bytes=PARTITION_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.catalog = read_catalog(partitions_dir)
+        self.version = self.catalog['version']
+
+        # partition key -> its segments: column directories (see
+        # batch_segment for batches), or frames when the snapshot couldn't be
+        # written. path=None serves an existing
+        # snapshot without checking it against a csv
+        self.segments = {}
+        if path is None:
+            with open(os.path.join(snapshot_dir, 'manifest.json')) as f:
+                manifest, base = json.load(f), None
+        else:
+            manifest, base = load_snapshot(path, snapshot_dir)
+        # the snapshot directory this store was opened on, not the symlink,
+        # so a rebuild from a new csv doesn't change what it reads
+        snapshot_dir = os.path.realpath(snapshot_dir)
+        # sale ids of the base csv, which batches may repeat
+        ids_path = os.path.join(snapshot_dir, 'sale_ids.npy')
+        if manifest is None:
+            base_ids = csv_sale_ids(path)
+        elif os.path.exists(ids_path):
+            base_ids = np.load(ids_path)
+        else:
+            base_ids = np.array([], dtype=np.uint64)
+        # digest of the sales csv & coordinates the base snapshot was built
+        # from (empty for a snapshot written without one)
+        self.source = manifest.get('digest', '') if manifest is not None \
+            else snapshot_digest(source_stamp(path), base)
+
+        # partition key -> GEOID -> version of that tract's sales: the base
+        # snapshot's digest plus those of the batches adding to it. '*' stands
+        # for every tract of a partition written without digests
+        self.tract_versions = {}
+        if manifest is not None:
+            for key in manifest['partitions']:
+                self.segments.setdefault(key, []).append(os.path.join(snapshot_dir, key))
+                self.tract_versions[key] = dict(
+                    manifest.get('tracts', {}).get(key, {'*': self.source[:16]}))
+        else:
+            for key, rows in partition_rows(base).items():
+                self.segments[key] = [base.iloc[rows].reset_index(drop=True)]
+                self.tract_versions[key] = tract_digests(self.segments[key][0])
+        for batch in self.catalog['partitions']:
+            batch_dir = os.path.join(partitions_dir, batch['name'])
+            with open(os.path.join(batch_dir, 'manifest.json')) as f:
+                batch_tracts = json.load(f).get('tracts', {})
+            for key in batch['segments']:
+                segment = batch_segment(os.path.join(batch_dir, key), base_ids)
+                if segment is None:
+                    continue
+                self.segments.setdefault(key, []).append(segment)
+                versions = self.tract_versions.setdefault(key, {})
+                for geoid, digest in batch_tracts.get(key, {'*': batch['name']}).items():
+                    versions[geoid] = versions.get(geoid, '') + '+' + digest
+
+        self._lock = threading.Lock()
+        self._resident = OrderedDict()
+        self.resident_bytes = 0
+        self.stats = Counter()
+
+    @property
+    def counties(self):
+        # counties in COUNTIES only: sales of any other county (a csv row or
+        # batch from before it was quarantined at ingest) have no tract file
+        # or sub-geographies to show them with
+        return sorted({key.split('/')[0] for key in self.segments} & COUNTIES.keys())
+
+    def years(self, county):
+        return sorted(int(key.split('/')[1]) for key in self.segments
+                      if key.split('/')[0] == county)
+
+    def keys(self, counties, years=None):
+        # partition keys for the given counties, within the [years[0],
+        # years[1]] sale-year range if one is given
+        return [partition_key(c, y) for c in counties for y in self.years(c)
+                if years is None or years[0] <= y <= years[1]]
+
+    @property
+    def dataset_version(self):
+        # changes with the base snapshot's source csv and with every ingest
+        return f'{self.source[:16]}.{self.version}'
+
+    def version_of(self, counties, years=None, geoids=None):
+        # data version of just these partitions, and of just these tracts in
+        # them if `geoids` is given. results over tracts & sale years that a
+        # new csv or an ingest left alone keep their version and stay cached
+        parts = []
+        for key in self.keys(counties, years):
+            versions = self.tract_versions.get(key, {})
+            tracts = versions if geoids is None else \
+                [g for g in map(str, geoids) if g in versions] + ['*'] * ('*' in versions)
+            parts.append(key + ':' + ','.join(f'{g}={versions[g]}' for g in sorted(tracts)))
+        return hashlib.sha256('|'.join(parts).encode()).hexdigest()[:16]
+
+    def partition(self, key):
+        with self._lock:
+            if key in self._resident:
+                self.stats['hits'] += 1
+                self._resident.move_to_end(key)
+                return self._resident[key]
+
+        frames = [read_segment(s) for s in self.segments[key]]
+        df = freeze(concat_sales(frames))
+        nbytes = int(df.memory_usage(index=True).sum())
+
+        with self._lock:
+            self.stats['loads'] += 1
+            if key not in self._resident:
+                self._resident[key] = df
+                self.resident_bytes += nbytes
+            while self.resident_bytes > self.max_bytes and len(self._resident) > 1:
+                _, evicted = self._resident.popitem(last=False)
+                self.resident_bytes -= int(evicted.memory_usage(index=True).sum())
+                self.stats['evictions'] += 1
+            return self._resident.get(key, df)
+
+    def select(self, counties=None, years=None):
+        # the sales of these counties (all by default) and sale years, as one
+        # read-only frame
+        counties = self.counties if counties is None else counties
+        return freeze(concat_sales([self.partition(k)
+                                    for k in self.keys(counties, years)]))
+
+
+def load_sales(path=SALES_CSV, snapshot_dir=SNAPSHOT_DIR,
+               partitions_dir=PARTITIONS_DIR):
+    # every sale: the base csv (via its snapshot) plus every ingest batch
+    return SalesStore(path, snapshot_dir, partitions_dir).select()
+
+
+def freeze(df):
+    # rebuild the frame one column per block, each backed by a read-only array.
+    # the result can be handed to every session as-is: filters produce new
+    # frames, and any accidental in-place write raises instead of leaking
+    # into other sessions. memory-mapped snapshot columns are already
+    # read-only and are passed through without a copy
+    columns = {}
+    for col in df.columns:
+        values = df[col].array
+        if isinstance(values, pd.Categorical):
+            codes = values.codes.copy()
+            codes.flags.writeable = False
+            values = pd.Categorical.from_codes(codes, dtype=values.dtype)
+        else:
+            values = df[col].to_numpy()
+            if values.flags.writeable:
+                values = values.copy()
+                values.flags.writeable = False
+        columns[col] = values
+
+    # a RangeIndex is immutable and takes no per-row memory; keep it
+    index = df.index
+    if not isinstance(index, pd.RangeIndex):
+        values = index.to_numpy(copy=True)
+        values.flags.writeable = False
+        index = pd.Index(values, copy=False)
+
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the partitioned, typed columnar snapshot of the sales csv.')
+    parser.add_argument('--csv', default=SALES_CSV)
+    parser.add_argument('--out', default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    df = read_sales_csv(args.csv)
+    write_snapshot(df, args.csv, args.out)
+    print(f'wrote {len(df):,} rows to {args.out}/ as {len(partition_rows(df))} partitions')
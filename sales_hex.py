@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+import sales_cube
+import tract_geometry
+
+# hexagon width on screen at the map's zoom; the ground size follows the zoom
+HEX_PIXELS = 24
+
+SQRT3 = np.sqrt(3)
+
+
+def hex_size(zoom, lat):
+    # center-to-corner meters of a pointy-top hexagon HEX_PIXELS wide at this
+    # zoom and latitude
+    return tract_geometry.meters_per_pixel(zoom, lat) * HEX_PIXELS / SQRT3
+
+
+def select_sales(df, years, year_built, sub_geos=None):
+    # the geocoded sales of one filter state
+    vintage = sales_cube.vintage_bucket(df['year_blt'].to_numpy())
+    vintages = list(sales_cube.VINTAGE_BUCKETS)
+    keep = ((df['year_sale'].to_numpy() >= years[0]) &
+            (df['year_sale'].to_numpy() <= years[1]) &
+            (vintage >= vintages.index(year_built[0])) &
+            (vintage <= vintages.index(year_built[1])) &
+            np.isfinite(df['lat'].to_numpy()))
+    if sub_geos is not None:
+        keep &= df['Sub_geo'].isin(sub_geos).to_numpy()
+    return df[keep]
+
+
+def hex_bins(lat, long, price_sf, zoom):
+    # bin sales into a hexagonal grid and return one row per non-empty hex:
+    # its corner polygon, sale count and median price / SF. the grid lives on
+    # a local equirectangular projection around the sales' mean latitude,
+    # which is flat enough at county to metro scale
+    lat = np.asarray(lat, dtype=np.float64)
+    long = np.asarray(long, dtype=np.float64)
+    price_sf = np.asarray(price_sf, dtype=np.float64)
+    if not len(lat):
+        return pd.DataFrame({'polygon': [], 'count': np.array([], dtype=np.int64),
+                             'price_sf': np.array([], dtype=np.float64)})
+
+    lat0 = lat.mean()
+    x_scale = tract_geometry.METERS_PER_DEGREE * np.cos(np.radians(lat0))
+    y_scale = tract_geometry.METERS_PER_DEGREE
+    size = hex_size(zoom, lat0)
+    x, y = long * x_scale, lat * y_scale
+
+    # fractional axial coordinates, rounded to the nearest hex in cube space
+    q = (SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    cube = np.stack([q, r, -q - r])
+    rounded = np.round(cube)
+    error = np.abs(rounded - cube)
+    worst = np.argmax(error, axis=0)
+    columns = np.arange(len(q))
+    # the coordinate that moved most is recomputed so the three sum to zero
+    rounded[worst, columns] = 0
+    rounded[worst, columns] = -rounded.sum(axis=0)[columns]
+    q, r = rounded[0].astype(np.int64), rounded[1].astype(np.int64)
+
+    # one integer id per occupied hex, then medians from a (hex, value) sort.
+    # the q / r range of a filter state is small, so ids come from a bincount
+    # over the dense key space rather than np.unique
+    q_min, r_min = q.min(), r.min()
+    n_r = r.max() - r_min + 1
+    key = (q - q_min) * n_r + (r - r_min)
+    occupied = np.flatnonzero(np.bincount(key))
+    dense = np.zeros(occupied[-1] + 1, dtype=np.int64)
+    dense[occupied] = np.arange(len(occupied))
+    hex_id = dense[key]
+    hexes = np.stack([occupied // n_r + q_min, occupied % n_r + r_min], axis=1)
+
+    # sort by value, then stably by hex; ids fit int16 at any sensible zoom,
+    # where numpy's stable sort is a radix sort
+    order = np.argsort(price_sf)
+    id_dtype = np.int16 if len(occupied) < 2 ** 15 else np.int32
+    order = order[np.argsort(hex_id[order].astype(id_dtype), kind='stable')]
+    sorted_price = price_sf[order]
+    count = np.bincount(hex_id, minlength=len(hexes))
+    start = np.concatenate([[0], np.cumsum(count)[:-1]])
+    median = (sorted_price[start + (count - 1) // 2] + sorted_price[start + count // 2]) / 2
+
+    # hex centers back to degrees, then the six corners of each
+    center_x = size * SQRT3 * (hexes[:, 0] + hexes[:, 1] / 2)
+    center_y = size * 1.5 * hexes[:, 1]
+    angles = np.radians(60 * np.arange(6) - 30)
+    corner_x = (center_x[:, None] + size * np.cos(angles)[None, :]) / x_scale
+    corner_y = (center_y[:, None] + size * np.sin(angles)[None, :]) / y_scale
+    corners = np.stack([corner_x, corner_y], axis=2).round(tract_geometry.COORD_DECIMALS)
+
+    return pd.DataFrame({
+        'polygon': corners.tolist(),
+        'count': count,
+        'price_sf': median,
+    })
@@ -0,0 +1,90 @@
+import numpy as np
+
+# points kept per cube cell. a selection's quantiles are off by at most
+# sum(ceil(cell rows / SKETCH_SIZE)) ranks, about 1/SKETCH_SIZE of its rows
+SKETCH_SIZE = 64
+
+
+class QuantileSketch:
+    # fixed-size, mergeable quantile summaries for every SalesCube cell.
+    #
+    # a cell with n sorted values is cut into `size` blocks of consecutive
+    # ranks; each block is represented by its middle value, weighted by the
+    # block length. cells with n <= size keep every value and are exact.
+    # merging cells is just pooling their weighted points, and for any value
+    # x the pooled weight at or below x differs from the true count by less
+    # than one block per cell, which is where the rank bound above comes from.
+    # only the points are kept, so memory and query cost scale with
+    # cells * size, never with rows
+
+    def __init__(self, cell, counts, columns, size=SKETCH_SIZE):
+        # `cell` is every row's cell id, `counts` the rows per cell and
+        # `columns` measure -> row values, as CellStore takes them
+        self.size = size
+        self.rank_error = 1 / size
+
+        n_points = np.minimum(counts, size)
+        self.offsets = np.concatenate([[0], np.cumsum(n_points)])
+        point_cell = np.repeat(np.arange(len(counts)), n_points)
+        j = np.arange(self.offsets[-1]) - self.offsets[point_cell]
+        n = counts[point_cell]
+        m = n_points[point_cell]
+
+        # block j covers cell ranks [j * n / m, (j + 1) * n / m)
+        block_start = (j * n) // m
+        block_end = ((j + 1) * n) // m
+        self.weights = block_end - block_start
+        cell_offsets = np.concatenate([[0], np.cumsum(counts)])
+        middle = cell_offsets[point_cell] + (block_start + block_end - 1) // 2
+
+        # rows are grouped by cell once; each measure then only sorts within
+        # cells, far cheaper than the global sort exact selection needs
+        order = np.argsort(cell, kind='stable')
+        filled = np.flatnonzero(counts)
+        self.points = {}
+        for measure, values in columns.items():
+            cell_values = values[order]
+            for c in filled:
+                cell_values[cell_offsets[c]:cell_offsets[c + 1]].sort()
+            self.points[measure] = cell_values[middle].astype(np.float64)
+
+    def quantiles(self, measure, cell_groups, qs):
+        # approximate quantiles over each group of cells, same shape and
+        # interpolation as CellStore.quantiles
+        if not len(cell_groups):
+            return np.empty((0, len(qs)))
+
+        cells = np.concatenate(cell_groups)
+        cell_group = np.repeat(np.arange(len(cell_groups)),
+                               [len(c) for c in cell_groups])
+
+        # gather every point of the selected cells
+        lengths = self.offsets[cells + 1] - self.offsets[cells]
+        first = np.repeat(self.offsets[cells] - np.cumsum(lengths) + lengths,
+                          lengths)
+        idx = first + np.arange(lengths.sum())
+        group = np.repeat(cell_group, lengths)
+        values = self.points[measure][idx]
+        weights = self.weights[idx]
+
+        # sort by (group, value); cumulative weight marks each point's last rank
+        order = np.lexsort((values, group))
+        values, weights, group = values[order], weights[order], group[order]
+        cum = np.cumsum(weights)
+        total = np.bincount(group, weights=weights,
+                            minlength=len(cell_groups)).astype(np.int64)
+        group_start = np.concatenate([[0], np.cumsum(total)[:-1]])
+
+        position = (total[:, None] - 1) * np.asarray(qs, dtype=np.float64)[None, :]
+        below = np.floor(position).astype(np.int64)
+        above = np.ceil(position).astype(np.int64)
+
+        def value_at(rank):
+            # value of the point whose block holds this (0-based) rank
+            hit = np.searchsorted(cum, group_start[:, None] + rank, side='right')
+            return values[np.minimum(hit, len(values) - 1)] if len(values) \
+                else np.full(rank.shape, np.nan)
+
+        low, high = value_at(below), value_at(above)
+        result = low + (position - below) * (high - low)
+        return np.where(total[:, None] > 0, result, np.nan)
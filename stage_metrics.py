@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# per-stage timing of dashboard reruns. v2_dash.py times each stage of a
+# rerun into a Rerun, and a process-wide StageMetrics keeps the recent ones of
+# every session for p50 / p95s. set STAGE_METRICS_LOG to also append one JSON
+# line per rerun to a file, which several processes can share:
+#
+#   python stage_metrics.py stage_metrics.jsonl
+#
+# summarizes such a log across processes
+STAGE_METRICS_LOG = os.environ.get('STAGE_METRICS_LOG', '')
+
+# recent reruns kept per process for the percentiles
+SAMPLES_PER_STAGE = 2000
+
+
+class Rerun:
+    # the stages of one rerun in the order they finished. a stage's cache is
+    # 'hit' unless a cached function's body ran inside it ('miss', with the
+    # functions in 'computed'), or the shared result cache answered it
+    # ('disk'). stages with nothing cached behind them have no cache outcome
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = []
+        self._open = []
+
+    @contextmanager
+    def stage(self, name, cached=True):
+        record = {'stage': name, 'ms': None, 'rows': None,
+                  'cache': 'hit' if cached else None, 'computed': []}
+        self._open.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = (time.perf_counter() - start) * 1e3
+            self._open.remove(record)
+            self.stages.append(record)
+
+    def computed(self, function):
+        # called from the body of a cached function, which only runs on a miss
+        for record in self._open:
+            if record['cache'] is not None:
+                record['cache'] = 'miss'
+            record['computed'].append(function)
+
+    def record(self):
+        total = (time.perf_counter() - self._start) * 1e3
+        return {'time': self.started, 'pid': os.getpid(), 'total_ms': total,
+                'stages': self.stages}
+
+
+def percentiles(ms):
+    p50, p95 = np.percentile(ms, [50, 95]) if len(ms) else (np.nan, np.nan)
+    return float(p50), float(p95)
+
+
+def summarize(records):
+    # p50 / p95 wall time & cache outcome counts per stage over rerun records
+    ms, caches = defaultdict(list), defaultdict(lambda: defaultdict(int))
+    for record in records:
+        ms['(rerun)'].append(record['total_ms'])
+        for stage in record['stages']:
+            ms[stage['stage']].append(stage['ms'])
+            if stage['cache'] is not None:
+                caches[stage['stage']][stage['cache']] += 1
+    summary = []
+    for name, values in ms.items():
+        p50, p95 = percentiles(values)
+        summary.append({'stage': name, 'reruns': len(values), 'p50_ms': p50,
+                        'p95_ms': p95, **caches[name]})
+    return summary
+
+
+class StageMetrics:
+    # recent reruns of every session in this process. safe to share
+
+    def __init__(self, log_path=STAGE_METRICS_LOG, samples=SAMPLES_PER_STAGE):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=samples)
+
+    def add(self, rerun):
+        record = rerun.record()
+        with self._lock:
+            self._records.append(record)
+            if self.log_path:
+                with open(self.log_path, 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+        return record
+
+    def summary(self):
+        with self._lock:
+            records = list(self._records)
+        return summarize(records)
+
+    def to_json(self):
+        with self._lock:
+            records = list(self._records)
+        return json.dumps({'summary': summarize(records), 'reruns': records}, indent=2)
+
+
+def read_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('logs', nargs='+', help='STAGE_METRICS_LOG files')
+    args = parser.parse_args()
+
+    records = [r for path in args.logs for r in read_log(path)]
+    print(f'{len(records):,} reruns from {len({r["pid"] for r in records})} processes\n')
+    print(f"{'stage':>14} {'reruns':>7} {'p50 ms':>8} {'p95 ms':>8} {'hit':>6} "
+          f"{'miss':>6} {'disk':>6}")
+    for row in sorted(summarize(records), key=lambda r: -r['p95_ms']):
+        print(f"{row['stage']:>14} {row['reruns']:>7,} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row.get('hit', 0):>6,} {row.get('miss', 0):>6,} "
+              f"{row.get('disk', 0):>6,}")
+
+
+if __name__ == '__main__':
+    main()
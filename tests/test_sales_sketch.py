@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import sales_cube
+import sales_data
+from benchmarks.sketch_accuracy import check_bounds
+
+
+@pytest.fixture(scope='module')
+def sales():
+    return sales_data.load_sales()
+
+
+# the default size, and a small one so most cells are summarized rather
+# than kept whole
+@pytest.mark.parametrize('size', [sales_cube.SKETCH_SIZE, 8])
+def test_sketch_quantiles_within_rank_bound(sales, size):
+    checked, violations, _ = check_bounds(sales, size)
+    assert checked > 0
+    assert violations == []
+
+
+def test_sketch_engine_keeps_no_exact_index(sales):
+    cube = sales_cube.SalesCube(sales, engine='sketch')
+    assert not hasattr(cube, 'keys')
+    assert not hasattr(cube, 'sorted_values')
+
+
+def test_sketch_is_exact_for_small_cells(sales):
+    # cells no larger than the sketch keep every value
+    exact = sales_cube.SalesCube(sales)
+    sketch = sales_cube.SalesCube(sales, engine='sketch', sketch_size=int(exact.counts.max()))
+    cells = list(exact.cells((2021, 2023), ('<2000', '2011-2023')))
+    for measure in sales_cube.CUBE_MEASURES:
+        np.testing.assert_allclose(sketch.engine.quantiles(measure, cells, [0.25, 0.5, 0.75]),
+                                   exact.quantiles(measure, cells, [0.25, 0.5, 0.75]))
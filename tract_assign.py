@@ -0,0 +1,128 @@
+import argparse
+import os
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import sales_data
+import tract_geometry
+
+# CRS the county geocodes are in (matches the tract files)
+POINTS_CRS = 'EPSG:4269'
+
+
+class TractIndex:
+    # Census tract polygons from one or more tract files, prepared once, for
+    # bulk point-in-polygon assignment of geocoded sales.
+    #
+    # points are sorted by longitude once per batch; each tract then only
+    # tests the points inside its bounding box (a binary search on longitude
+    # plus a latitude mask) with shapely's vectorized contains_xy. this beat
+    # both geopandas' sjoin and an STRtree over the polygons, which spend most
+    # of their time building a shapely Point per sale
+
+    def __init__(self, tract_paths=tuple(tract_geometry.COUNTY_TRACTS.values()),
+                 lookup_path=sales_data.SUB_GEO_LOOKUP):
+        tracts = pd.concat([gpd.read_file(p).to_crs(POINTS_CRS)[['GEOID', 'geometry']]
+                            for p in tract_paths], ignore_index=True)
+        self.geoids = tracts['GEOID'].astype('int64').to_numpy()
+        self.polygons = tracts.geometry.values.to_numpy()
+        shapely.prepare(self.polygons)
+        self.bounds = shapely.bounds(self.polygons)
+
+        lookup = pd.read_csv(lookup_path)
+        self.sub_geo = lookup.set_index('GEOID')['Sub_geo']
+
+    def locate(self, lat, long):
+        # tract GEOID for every point, -1 where no tract contains it
+        lat = np.asarray(lat, dtype=np.float64)
+        long = np.asarray(long, dtype=np.float64)
+        order = np.argsort(long, kind='stable')
+        sorted_long = long[order]
+
+        geoid = np.full(len(lat), -1, dtype=np.int64)
+        starts = np.searchsorted(sorted_long, self.bounds[:, 0], side='left')
+        ends = np.searchsorted(sorted_long, self.bounds[:, 2], side='right')
+        for tract, (lo, hi) in enumerate(zip(starts, ends)):
+            candidates = order[lo:hi]
+            min_lat, max_lat = self.bounds[tract, [1, 3]]
+            candidates = candidates[(lat[candidates] >= min_lat) &
+                                    (lat[candidates] <= max_lat) &
+                                    # overlapping tract files: the first one wins
+                                    (geoid[candidates] < 0)]
+            inside = shapely.contains_xy(self.polygons[tract],
+                                         long[candidates], lat[candidates])
+            geoid[candidates[inside]] = self.geoids[tract]
+        return geoid
+
+    def assign(self, df, lat='lat', long='long'):
+        # split geocoded rows into (assigned, rejects). assigned rows gain
+        # GEOID and Sub_geo; rejects keep their columns plus a reject_reason:
+        #   invalid_coordinates - missing, 'error' or not a lat / long at all
+        #   outside_tracts      - a real location outside every loaded tract
+        #   unknown_county      - tract of a county missing from COUNTIES
+        #   no_sub_geo          - tract missing from the Sub_geo lookup
+        lat_values = pd.to_numeric(df[lat], errors='coerce').to_numpy(dtype=float)
+        long_values = pd.to_numeric(df[long], errors='coerce').to_numpy(dtype=float)
+        valid = (np.isfinite(lat_values) & np.isfinite(long_values) &
+                 (np.abs(lat_values) <= 90) & (np.abs(long_values) <= 180))
+
+        geoid = np.full(len(df), -1, dtype=np.int64)
+        geoid[valid] = self.locate(lat_values[valid], long_values[valid])
+        sub_geo = self.sub_geo.reindex(geoid).to_numpy()
+
+        reason = np.full(len(df), '', dtype=object)
+        served = np.isin(geoid // 10 ** 6, list(sales_data.COUNTIES.values()))
+        reason[pd.isna(sub_geo)] = 'no_sub_geo'
+        reason[~served] = 'unknown_county'
+        reason[geoid < 0] = 'outside_tracts'
+        reason[~valid] = 'invalid_coordinates'
+        ok = reason == ''
+
+        assigned = df[ok].assign(lat=lat_values[ok], long=long_values[ok],
+                                 GEOID=geoid[ok], Sub_geo=sub_geo[ok])
+        rejects = df[~ok].assign(reject_reason=reason[~ok])
+        return assigned, rejects
+
+
+def quarantine(rejects, path, key=None):
+    # append rejects to the reject file for manual geocoding. with a `key`
+    # column, rows whose key the file already has are left out, so re-running
+    # over the same exports doesn't repeat them
+    header = not os.path.exists(path) or os.path.getsize(path) == 0
+    if key is not None and not header:
+        listed = pd.read_csv(path, usecols=[key], dtype=str)[key]
+        rejects = rejects[~rejects[key].astype(str).isin(listed)]
+    if not len(rejects):
+        return
+    rejects.to_csv(path, mode='a', header=header, index=False)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Assign geocoded sales to Census tracts.')
+    parser.add_argument('geocoded_csv', help='csv with lat / long columns')
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--rejects', required=True,
+                        help='csv the unassignable rows are appended to')
+    parser.add_argument('--tracts', nargs='+',
+                        default=list(tract_geometry.COUNTY_TRACTS.values()),
+                        help='one or more tract files, every county by default')
+    parser.add_argument('--lookup', default=sales_data.SUB_GEO_LOOKUP)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.geocoded_csv)
+    start = time.perf_counter()
+    index = TractIndex(args.tracts, args.lookup)
+    assigned, rejects = index.assign(df)
+    elapsed = time.perf_counter() - start
+
+    assigned.to_csv(args.out, index=False)
+    quarantine(rejects, args.rejects)
+    print(f'{len(assigned):,} of {len(df):,} rows assigned in {elapsed:.2f}s, '
+          f'{len(rejects):,} quarantined to {args.rejects}')
+    for reason, n in rejects['reject_reason'].value_counts().items():
+        print(f'  {reason}: {n:,}')
@@ -0,0 +1,105 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+TRACTS_GPKG = 'Geography/Forsyth_CTs.gpkg'
+
+# tract file of every county in sales_data.COUNTIES
+COUNTY_TRACTS = {
+    'Forsyth': TRACTS_GPKG,
+}
+
+# decimal places kept on tract coordinates, ~1 m at this latitude. finer
+# detail is sub-pixel at every zoom the map allows
+COORD_DECIMALS = 5
+
+# levels of detail, by the map zoom each one is built for: tracts simplified
+# to half a screen pixel at that zoom, with shared edges kept shared, and
+# coordinates snapped to the coarsest grid finer than that. views zoomed in
+# past the last level get the full-resolution shapes
+LOD_ZOOMS = (8, 10, 12, 14)
+
+METERS_PER_DEGREE = 111_320
+
+
+def meters_per_pixel(zoom, lat):
+    # web mercator ground resolution of a 512 px deck.gl tile
+    return 40_075_016.7 * np.cos(np.radians(lat)) / (512 * 2 ** zoom)
+
+
+def quantize(geoms, decimals=COORD_DECIMALS):
+    # snap to the grid first so rounding can't create invalid rings
+    geoms = shapely.set_precision(geoms, 10 ** -decimals)
+    return shapely.transform(geoms, lambda coords: coords.round(decimals))
+
+
+def simplify_tracts(geoms, tolerance):
+    # coverage simplification moves each shared edge once, so neighbouring
+    # tracts stay gap- and overlap-free. shapely < 2.1 has no coverage
+    # simplify; per-polygon simplification can open slivers between tracts
+    if hasattr(shapely, 'coverage_simplify'):
+        return shapely.coverage_simplify(geoms, tolerance)
+    return shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+
+def read_tracts(path=TRACTS_GPKG):
+    return gpd.read_file(path).to_crs(epsg=4326)
+
+
+def load_tract_shapes(path=TRACTS_GPKG, decimals=COORD_DECIMALS):
+    # read, reproject and quantize the tract polygons once. returns a dict of
+    # GEOID (int) -> GeoJSON geometry, ready to be dropped into layer records
+    gdf = read_tracts(path)
+    geoms = quantize(gdf.geometry.values, decimals)
+
+    return {int(geoid): mapping(geom)
+            for geoid, geom in zip(gdf['GEOID'], geoms)}
+
+
+def load_tract_lods(path=TRACTS_GPKG, zooms=LOD_ZOOMS):
+    # every level of detail of one tract file: a list of (zoom, shapes) from
+    # coarsest to finest, shapes as returned by load_tract_shapes. the last
+    # level is the full-resolution one, with zoom None
+    gdf = read_tracts(path)
+    min_x, min_y, max_x, max_y = gdf.total_bounds
+    lat = (min_y + max_y) / 2
+
+    levels = []
+    for zoom in zooms:
+        tolerance = meters_per_pixel(zoom, lat) / 2 / METERS_PER_DEGREE
+        decimals = min(int(np.ceil(-np.log10(tolerance))), COORD_DECIMALS)
+        geoms = quantize(simplify_tracts(gdf.geometry.values, tolerance), decimals)
+        levels.append((zoom, {int(geoid): mapping(geom)
+                              for geoid, geom in zip(gdf['GEOID'], geoms)}))
+
+    levels.append((None, load_tract_shapes(path)))
+    return levels
+
+
+def shapes_for_zoom(levels, zoom):
+    # the coarsest level still within half a pixel at this zoom
+    for level_zoom, shapes in levels:
+        if level_zoom is None or level_zoom >= zoom:
+            return shapes
+
+
+def view_center(shapes):
+    # (latitude, longitude) of the middle of the tracts' bounding box, where
+    # the map opens
+    bounds = np.array([shape(geom).bounds for geom in shapes.values()])
+    return ((bounds[:, 1].min() + bounds[:, 3].max()) / 2,
+            (bounds[:, 0].min() + bounds[:, 2].max()) / 2)
+
+
+def tract_records(shapes, df):
+    # one pydeck record per tract: the attribute columns of `df` plus the
+    # cached geometry. tracts missing from either side are dropped
+    # built column-wise from python lists; to_dict(orient='records') boxes
+    # every cell and is several times slower past a few thousand tracts
+    df = df[df['GEOID'].isin(shapes.keys())]
+    columns = list(df.columns)
+    records = [dict(zip(columns, row)) for row in zip(*(df[c].tolist() for c in columns))]
+    for record in records:
+        record['geometry'] = shapes[record['GEOID']]
+    return records
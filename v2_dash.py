@@ -1,10 +1,16 @@
 import streamlit as st
 from PIL import Image
+import os
 import pandas as pd
-import geopandas as gpd
-import plotly.express as px
-import pydeck as pdk
-from datetime import date
+import threading
+import dash_views
+import map_layers
+import result_cache
+import sales_cube
+import sales_data
+import stage_metrics
+import tract_geometry
+import warmup
 
 # customize
 st.set_page_config(
@@ -43,27 +49,108 @@ hide_default_format = """
 
 st.markdown(hide_default_format, unsafe_allow_html=True)
 
+# wall time, rows & cache outcome of each stage of this rerun. cached
+# functions call rerun.computed() first thing, so a stage that ran one of
+# their bodies is marked a miss. see stage_metrics.py
+rerun = stage_metrics.Rerun()
+
+
+# every session's reruns in this process, for the diagnostics panel
+@st.cache_resource(max_entries=1)
+def load_stage_metrics():
+    return stage_metrics.StageMetrics()
+
+
+# ingest batches, and the csv's size & mtime. checked on every rerun, so a
+# new ingest or a replaced csv is picked up without a restart
+with rerun.stage('catalog', cached=False):
+    catalog = sales_data.read_catalog()
+    data_version = sales_data.data_stamp(catalog)
+
+
+# one sales store per process, shared by every session. it only knows which
+# partitions exist; a partition's columns are memory-mapped from the typed
+# snapshot the first time a filter needs them, and the least recently used
+# are dropped past sales_data.PARTITION_CACHE_BYTES. a new data version opens
+# a new store (rebuilding the snapshot if the csv changed) and swaps it in
+# for the next reruns; reruns already holding the old one finish on it.
+# see sales_data.py
+@st.cache_resource(max_entries=1)
+def load_sales_store(data_version):
+    rerun.computed('load_sales_store')
+    return sales_data.SalesStore()
+
+
+with rerun.stage('store'):
+    sales_store = load_sales_store(data_version)
+
+
+# rendered maps, charts & KPIs on disk, shared by every server process on the
+# host. each is keyed by the version of the sale years & tracts it covers, so
+# a new dataset only misses on the results whose data changed. see
+# result_cache.py
+@st.cache_resource(max_entries=1)
+def load_result_cache(path):
+    return result_cache.ResultCache(path) if path else None
+
+
+results = load_result_cache(result_cache.RESULT_CACHE)
+
+
+# the background warm-up this server process started: the dataset version it
+# covers and its process
+@st.cache_resource
+def warmup_state():
+    return {'lock': threading.Lock(), 'version': None, 'process': None}
+
+
+# render the common sidebar states into the result cache from a background
+# process pool, so visitors get cache hits. ingest.py starts one after each
+# batch; this covers a deploy and any version nothing has warmed yet (a run
+# that finds the states cached ends quickly). every rerun polls the running
+# process, which reaps it once it exits, and a new version waits for it.
+# see warmup.py; set WARMUP=0 to skip
+def start_warmup(dataset_version):
+    state = warmup_state()
+    with state['lock']:
+        if state['process'] is not None and state['process'].poll() is None:
+            return
+        state['process'] = None
+        if results is None or state['version'] == dataset_version:
+            return
+        state['version'] = dataset_version
+        state['process'] = warmup.start(result_cache.RESULT_CACHE)
+
+
+start_warmup(sales_store.dataset_version)
+
+
 # sidebar variables vvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvvv
 
 st.sidebar.markdown(
     f"<p style='text-align:center;color:#FFFFFF;font-style:italic;'>Filter housing data by:</p>", unsafe_allow_html=True)
 # st.sidebar.write("")
 
-# all the years available for selection
-years = st.sidebar.select_slider(
-    'Transaction year:',
-    options=[
-        2018,
-        2019,
-        2020,
-        2021,
-        2022,
-        2023
-    ],
-    value=(2021, 2023),
-    help='Filter sales by transaction year.'
+# counties with sales in the store
+county = st.sidebar.selectbox(
+    'County:',
+    sales_store.counties,
+    index=sales_store.counties.index('Forsyth') if 'Forsyth' in sales_store.counties else 0,
+    help='Choose the county to show.'
 )
 
+# all the years available for selection
+year_options = sales_store.years(county)
+if len(year_options) > 1:
+    years = st.sidebar.select_slider(
+        'Transaction year:',
+        options=year_options,
+        value=dash_views.default_years(year_options),
+        help='Filter sales by transaction year.'
+    )
+else:
+    years = (year_options[0], year_options[0])
+
 # dashboard title styling variables
 dash_title1_color = '#FFFFFF'
 dash_title1_font_weight = '900'
@@ -73,10 +160,10 @@ dash_title2_font_weight = '800'
 
 if years[0] != years[1]:
     st.markdown(
-        f"<h2 style='color:{dash_title1_color}; font-weight: {dash_title1_font_weight};'>Forsyth County Housing Trends | <span style='color:{dash_title2_color}; font-weight: {dash_title2_font_weight}'>{years[0]} - {years[1]}</span></h2>", unsafe_allow_html=True)
+        f"<h2 style='color:{dash_title1_color}; font-weight: {dash_title1_font_weight};'>{county} County Housing Trends | <span style='color:{dash_title2_color}; font-weight: {dash_title2_font_weight}'>{years[0]} - {years[1]}</span></h2>", unsafe_allow_html=True)
 else:
     st.markdown(
-        f"<h2 style='color:{dash_title1_color}; font-weight: {dash_title1_font_weight};'>Forsyth County Housing Trends | <span style='color:{dash_title2_color}; font-weight: {dash_title2_font_weight}'>{years[0]} only</span></h2>", unsafe_allow_html=True)
+        f"<h2 style='color:{dash_title1_color}; font-weight: {dash_title1_font_weight};'>{county} County Housing Trends | <span style='color:{dash_title2_color}; font-weight: {dash_title2_font_weight}'>{years[0]} only</span></h2>", unsafe_allow_html=True)
 
 # # square footage slider
 # sq_footage = st.sidebar.select_slider(
@@ -89,17 +176,11 @@ else:
 # construction vintage
 year_built = st.sidebar.select_slider(
     'Year built:',
-    options=['<2000', '2000-2010', '2011-2023'],
-    value=('2000-2010', '2011-2023'),
+    options=dash_views.YEAR_BUILT_OPTIONS,
+    value=dash_views.DEFAULT_YEAR_BUILT,
     help="Filter sales by the construction vintage of the home."
 )
 
-year_built_dict = {
-    '<2000': [0, 1999],
-    '2000-2010': [2000, 2010],
-    '2011-2023': [2011, 2050]
-}
-
 # sub-geography slider
 geography_included = st.sidebar.radio(
     'Geography included:',
@@ -108,406 +189,184 @@ geography_included = st.sidebar.radio(
     help='Filter sales by location. Defaults to entire county. "Sub-geography" filter will allow multi-select of smaller groupings within the county.'
 )
 sub_geo = ""
+sub_geo_options = sales_data.sub_geos(county)
 if geography_included == 'Sub-geography':
     sub_geo = st.sidebar.multiselect(
         'Select one or more regions:',
-        ['Cumming', 'North Forsyth', 'West Forsyth', 'South Forsyth'],
-        ['Cumming'],
+        sub_geo_options,
+        sub_geo_options[:1],
         help="Select one or more pre-defined groupings of Census tracts.")
 
+# with several regions picked, show each as its own KPI column & trend line
+# instead of one merged selection. the map still shows them merged
+compare_regions = False
+if geography_included == 'Sub-geography' and len(sub_geo) > 1:
+    compare_regions = st.sidebar.checkbox(
+        'Compare regions side by side',
+        value=False,
+        help="Show each selected region's KPIs and price / SF trend separately.")
+
 # Map options sidebar section
 st.sidebar.write("---")
 st.sidebar.markdown(
     f"<p style='text-align:center; color:#FFFFFF; font-style:italic; line-height:2px'>Map options:</p>", unsafe_allow_html=True)
 map_view = st.sidebar.radio(
     'Map view:',
-    ('2D', '3D'),
+    dash_views.MAP_VIEWS,
     index=0,
     horizontal=True,
     help='Toggle 3D view for extruded polygons which show "height" based on the quantity of total sales in each Census tract subject to the filters chosen. Shift + click to change pitch and rotation of map. Darker Census tract shading corresponds to higher median sales price per SF.'
 )
 
+map_layer = st.sidebar.radio(
+    'Map layer:',
+    dash_views.MAP_LAYERS,
+    index=0,
+    help='"Sales density" bins the individual geocoded sales into hexagons, shaded by their median price per SF. Only sales with coordinates are included.'
+)
+
 base_map = st.sidebar.selectbox(
     'Base map:',
-    ('Streets', 'Satellite', 'Gray'),
-    index=2,
+    tuple(dash_views.BASE_MAPS),
+    index=list(dash_views.BASE_MAPS).index(dash_views.DEFAULT_BASE_MAP),
     help='Change underlying base map.'
 )
 
-base_map_dict = {
-    'Streets': 'road',
-    'Satellite': 'satellite',
-    'Gray': 'light'
-}
+# Chart options sidebar section
+st.sidebar.write("---")
+st.sidebar.markdown(
+    f"<p style='text-align:center; color:#FFFFFF; font-style:italic; line-height:2px'>Chart options:</p>", unsafe_allow_html=True)
+trend_window = st.sidebar.selectbox(
+    'Rolling median:',
+    tuple(dash_views.TREND_WINDOWS),
+    index=0,
+    help='Overlay a trailing rolling median of price / SF on the chart. Each point pools every sale from that month and the months before it, which smooths out noisy monthly medians for small selections.'
+)
 
 # sidebar variables ^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
 
 
-@st.cache_data
-def load_tab_data():
-    # load the data
-    df = pd.read_csv('Geocoded_Final_Joined4.csv',
-                     thousands=',', keep_default_na=False)
-    df['Sale Price'] = df['Sale Price'].str.replace(
-        '[\$,]', '', regex=True).str.replace(',', '', regex=True)
-
-    df = df[[
-        'Square Ft',
-        'year_sale',
-        'year_blt',
-        'price_sf',
-        'Sale Price',
-        'GEOID',
-        'Sub_geo',
-        'unique_ID',
-        'year',
-        'month',
-        'year-month']]
-
-    # return this item
-    return df
+# quantile engine behind the map & KPIs: 'exact' (default) or 'sketch' for
+# bounded-error approximate quantiles at multi-county scale
+KPI_ENGINE = os.environ.get('KPI_ENGINE', 'exact')
 
 
-df_init = load_tab_data()
-
-
-def filter_data():
-    df = df_init
-
-    # vintage filter
-
-    # # long way
-    # if year_built[0] == '<2000' and year_built[1] == '<2000':
-    #     filtered_df = df[df['year_blt'] <= 1999]
-    # elif year_built[0] == '2000-2010' and year_built[1] == '2011-2023':
-    #     filtered_df = df[df['year_blt'] >= 2000]
-    # elif year_built[0] == '2011-2023' and year_built[1] == '2011-2023':
-    #     filtered_df = df[df['year_blt'] >= 2011]
-
-    # short way
-    lower_bound = year_built_dict[year_built[0]][0]
-    upper_bound = year_built_dict[year_built[1]][1]
-
-    filtered_df = df[(df['year_blt'] >= lower_bound) &
-                     (df['year_blt'] <= upper_bound)]
-
-    # filter by sub-geography (if applicable)
-    if geography_included == 'Sub-geography':
-        filtered_df = filtered_df[filtered_df['Sub_geo'].isin(sub_geo)]
-
-    # year filter
-    if years[0] != years[1]:
-        filtered_df_map_KPI = filtered_df[(filtered_df['year_sale'] >= years[0]) & (
-            filtered_df['year_sale'] <= years[1])]
-        df_KPI_delta0 = filtered_df[filtered_df['year_sale'] == years[0]]
-        df_KPI_delta1 = filtered_df[filtered_df['year_sale'] == years[1]]
-    else:
-        filtered_df_map_KPI = filtered_df[filtered_df['year_sale'] == years[0]]
-        # create dummy dataframes in the case that the transaction year sliders are superimposed
-        df_KPI_delta0 = pd.DataFrame({'price_sf': [100]})
-        df_KPI_delta1 = pd.DataFrame({'price_sf': [200]})
-
-    # now group by GEOID
-    grouped_df = filtered_df_map_KPI.groupby('GEOID').agg({
-        'price_sf': 'median',
-        'Sale Price': 'median',
-        'year_blt': 'median',
-        'unique_ID': 'count',
-    }).reset_index()
+# cubes, series & tract shapes kept per process. each is built from just the
+# partitions of one county, so memory follows what's being looked at rather
+# than how many counties the store holds
+RESOURCE_CACHE_ENTRIES = 8
 
-    return filtered_df, grouped_df, filtered_df_map_KPI, df_KPI_delta0, df_KPI_delta1
 
-
-# colors to be used in the mapping functions
-custom_colors = [
-    '#97a3ab',  # lightest blue
-    '#667883',
-    '#37505d',
-    '#022b3a'  # darkest blue
-]
-
-# convert the above hex list to RGB values
-custom_colors = [tuple(int(h.lstrip('#')[i:i+2], 16)
-                       for i in (0, 2, 4)) for h in custom_colors]
-
-
-def mapper_2D():
-
-    # tabular data
-    df = filter_data()[1]
-    df['GEOID'] = df['GEOID'].astype(str)
-
-    # read in geospatial
-    gdf = gpd.read_file('Geography/Forsyth_CTs.gpkg')
-
-    # join together the 2, and let not man put asunder
-    joined_df = gdf.merge(df, left_on='GEOID', right_on='GEOID')
-
-    # ensure we're working with a geodataframe
-    joined_df = gpd.GeoDataFrame(joined_df)
-
-    # format the column to show the price / SF
-    joined_df['price_sf_formatted'] = joined_df['price_sf'].apply(
-        lambda x: "${:.0f}".format((x)))
-
-    # format the column to show the price
-    joined_df['price_formatted'] = joined_df['Sale Price'].apply(
-        lambda x: "${:,.0f}".format((x)))
-
-    # add 1,000 separator to column that will show total sales
-    joined_df['total_sales'] = joined_df['unique_ID'].apply(
-        lambda x: '{:,}'.format(x))
-
-    # set choropleth color
-    joined_df['choro_color'] = pd.cut(
-        joined_df['price_sf'],
-        bins=len(custom_colors),
-        labels=custom_colors,
-        include_lowest=True,
-        duplicates='drop'
-    )
-
-    # create map intitial state
-    initial_view_state = pdk.ViewState(
-        latitude=34.207054643497315,
-        longitude=-84.10535919531371,
-        zoom=9.2,
-        max_zoom=15,
-        min_zoom=8,
-        pitch=0,
-        bearing=0,
-        height=565
-    )
-
-    geojson = pdk.Layer(
-        "GeoJsonLayer",
-        joined_df,
-        pickable=True,
-        autoHighlight=True,
-        highlight_color=[255, 255, 255, 80],
-        opacity=0.5,
-        stroked=True,
-        filled=True,
-        get_fill_color='choro_color',
-        get_line_color=[0, 0, 0, 255],
-        line_width_min_pixels=1
-    )
-
-    tooltip = {
-        "html": "Median price per SF: <b>{price_sf_formatted}</b><hr style='margin: 10px auto; opacity:0.5; border-top: 2px solid white; width:70%'>\
-                    Median price: <b>{price_formatted}</b><br>\
-                    Total sales: <b>{total_sales}</b>",
-        "style": {"background": "rgba(2,43,58,0.7)",
-                  "border": "1px solid white",
-                  "color": "white",
-                  "font-family": "Helvetica",
-                  "text-align": "center"
-                  },
-    }
-
-    r = pdk.Deck(
-        layers=geojson,
-        initial_view_state=initial_view_state,
-        map_provider='mapbox',
-        map_style=base_map_dict[base_map],
-        tooltip=tooltip)
-
-    return r
-
-
-def mapper_3D():
-
-    # tabular data
-    df = filter_data()[1]
-    df['GEOID'] = df['GEOID'].astype(str)
-
-    # read in geospatial
-    gdf = gpd.read_file('Geography/Forsyth_CTs.gpkg')
-
-    # join together the 2, and let not man put asunder
-    joined_df = gdf.merge(df, left_on='GEOID', right_on='GEOID')
-
-    # ensure we're working with a geodataframe
-    joined_df = gpd.GeoDataFrame(joined_df)
-
-    # format the column to show the price / SF
-    joined_df['price_sf_formatted'] = joined_df['price_sf'].apply(
-        lambda x: "${:.0f}".format((x)))
-
-    # add 1,000 separator to column that will show total sales
-    joined_df['total_sales'] = joined_df['unique_ID'].apply(
-        lambda x: '{:,}'.format(x))
-
-    # set choropleth color
-    joined_df['choro_color'] = pd.cut(
-        joined_df['price_sf'],
-        bins=len(custom_colors),
-        labels=custom_colors,
-        include_lowest=True,
-        duplicates='drop'
-    )
-
-    # set initial view state
-    initial_view_state = pdk.ViewState(
-        latitude=34.307054643497315,
-        longitude=-84.10535919531371,
-        zoom=9.2,
-        max_zoom=15,
-        min_zoom=8,
-        pitch=45,
-        bearing=0,
-        height=565
-    )
-
-    # create geojson layer
-    geojson = pdk.Layer(
-        "GeoJsonLayer",
-        joined_df,
-        pickable=True,
-        autoHighlight=True,
-        highlight_color=[255, 255, 255, 90],
-        opacity=0.5,
-        stroked=False,
-        filled=True,
-        wireframe=False,
-        extruded=True,
-        get_elevation='unique_ID * 50',
-        get_fill_color='choro_color',
-        get_line_color='choro_color',
-        line_width_min_pixels=1
-    )
-
-    tooltip = {
-        "html": "Median price per SF: <b>{price_sf_formatted}</b><br>Total sales: <b>{total_sales}</b>",
-        "style": {"background": "rgba(2,43,58,0.7)",
-                  "border": "1px solid white",
-                  "color": "white",
-                  "font-family": "Helvetica",
-                  "text-align": "center"
-                  },
-    }
-
-    r = pdk.Deck(
-        layers=geojson,
-        initial_view_state=initial_view_state,
-        map_provider='mapbox',
-        map_style=base_map_dict[base_map],
-        tooltip=tooltip)
-
-    return r
-
-
-def charter():
-    # test chart
-    df = filter_data()[0]
-
-    df_grouped = df.groupby('year-month').agg({
-        'price_sf': 'median',
-        'unique_ID': 'count',
-        'month': pd.Series.mode,
-        'year': pd.Series.mode,
-    }).reset_index()
-
-    # sort the data so that it's chronological
-    df_grouped = df_grouped.sort_values(['year', 'month'])
-
-    fig = px.line(
-        df_grouped,
-        x="year-month",
-        y='price_sf',
-        custom_data=['unique_ID']
-    )
-
-    # modify the line itself
-    fig.update_traces(
-        mode="lines",
-        line_color='#022B3A',
-        hovertemplate="<br>".join([
-            # "<b>%{x}</b><br>",
-            "Median price / SF: <b>%{y}</b>",
-            "Total sales: <b>%{customdata[0]:,.0f}</b>"
-        ])
-    )
-
-    # set chart title style variables
-    chart_title_font_size = '17'
-    chart_title_color = '#FFFFFF'
-    chart_title_font_weight = '650'
-
-    chart_subtitle_font_size = '14'
-    chart_subtitle_color = '#022B3A'
-    chart_subtitle_font_weight = '650'
-
-    if sub_geo == "":
-        chart_title_text = "Countywide Median Price / SF"
-    elif len(sub_geo) == 1:
-        chart_title_text = f"{sub_geo[0]} Median Price / SF"
-    elif len(sub_geo) == 2:
-        chart_title_text = f"{sub_geo[0]} & {sub_geo[1]} Median Price / SF"
-    else:
-        chart_title_text = f"Median Price / SF For Selected Regions"
-
-    # update the fig
-    fig.update_layout(
-        title_text=f'<span style="font-size:{chart_title_font_size}px; font-weight:{chart_title_font_weight}; color:{chart_title_color}">{chart_title_text}</span><br><span style="font-size:{chart_subtitle_font_size}px; font-weight:{chart_subtitle_font_weight}; color:{chart_subtitle_color}"><i>Orange lines reflect range of selected years</i></span>',
-        title_x=0,
-        title_y=0.93,
-        margin=dict(
-            t=85
-        ),
-        hoverlabel=dict(
-            bgcolor="rgba(255, 255, 255, 0.8)",
-            bordercolor="#022B3A",
-            font_size=16,  # set the font size of the chart tooltip
-            font_color="#022B3A",
-            align="left"
-        ),
-        yaxis=dict(
-            linecolor="#022B3A",
-            title=None,
-            tickfont_color='#022B3A',
-            tickfont_size=13,
-            tickformat='$.0f',
-            showgrid=False
-        ),
-        xaxis=dict(
-            linecolor="#022B3A",
-            linewidth=1,
-            tickfont_color='#022B3A',
-            title=None,
-            tickangle=90,
-            tickfont_size=13,
-            tickformat='%b %Y',
-            dtick='M3'
-        ),
-        height=460,
-        hovermode="x unified")
-
-    # add shifting vertical lines
-    year_start = {
-        2018: '2018-1',
-        2019: '2019-1',
-        2020: '2020-1',
-        2021: '2021-1',
-        2022: '2022-1',
-        2023: '2023-1'
-    }
-
-    year_end = {
-        2018: '2018-12',
-        2019: '2019-12',
-        2020: '2020-12',
-        2021: '2021-12',
-        2022: '2022-12',
-        2023: '2023-4'
-    }
-
-    fig.add_vline(x=year_start[years[0]], line_width=2,
-                  line_dash="dash", line_color="#FF8966")
-    fig.add_vline(x=year_end[years[1]], line_width=2,
-                  line_dash="dash", line_color="#FF8966")
-
-    return fig
+# (GEOID, sale year, vintage) cube answering the map & KPI medians for one
+# county, over all of its sale years: every year range is a slice of its
+# cells, so moving the slider never rebuilds it. `county_version` is
+# sales_store.version_of the county
+@st.cache_resource(max_entries=RESOURCE_CACHE_ENTRIES, show_spinner=False)
+def load_sales_cube(engine, county, county_version):
+    rerun.computed('load_sales_cube')
+    return sales_cube.SalesCube(sales_store.select([county]), engine=engine)
+
+
+# (Sub_geo, vintage, month) price / SF cells behind one county's trend chart
+@st.cache_resource(max_entries=RESOURCE_CACHE_ENTRIES, show_spinner=False)
+def load_monthly_series(county, partitions_version):
+    rerun.computed('load_monthly_series')
+    return sales_cube.MonthlySeries(sales_store.select([county]))
+
+
+# number of distinct filter states whose results are kept in memory. the whole
+# (years, vintage, geography) space is ~2k states per county, most visitors
+# hit a handful
+FILTER_CACHE_ENTRIES = 256
+
+
+# results are shared across sessions & evicted least-recently-used first.
+# `filter_version` / `trend_version` are the data versions of just the sale
+# years & tracts a result covers (see dash_views.data_versions), so an ingest
+# that adds 2023 sales in one region leaves cached 2019-2021 results, and
+# those of other regions, valid. the cubes & series they're built from are
+# looked up by the store's current version of what they cover
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def filter_data(county, years, year_built, geography_included, sub_geo, filter_version):
+    rerun.computed('filter_data')
+    cube = load_sales_cube(KPI_ENGINE, county, sales_store.version_of([county]))
+    return dash_views.filter_cube(cube, years, year_built, geography_included, sub_geo)
+
+
+# the chart covers every sale year of the county
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def trend_data(county, year_built, geography_included, sub_geo, window, trend_version):
+    # monthly median price / SF, or its trailing rolling median for window > 1
+    rerun.computed('trend_data')
+    return load_monthly_series(county, sales_store.version_of([county])).series(
+        year_built, dash_views.regions(geography_included, sub_geo), window)
+
+
+# kpis of each region in comparison mode, all regions in one cube pass
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def compare_data(county, years, year_built, sub_geo, filter_version):
+    rerun.computed('compare_data')
+    cube = load_sales_cube(KPI_ENGINE, county, sales_store.version_of([county]))
+    return dash_views.compare_cube(cube, years, year_built, sub_geo)
+
+
+# each region's monthly (or rolling) medians, in one query keyed by
+# (region, month) rather than a series per region
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def compare_trend_data(county, year_built, sub_geo, window, trend_version):
+    rerun.computed('compare_trend_data')
+    return load_monthly_series(county, sales_store.version_of([county])).compare(
+        year_built, sub_geo, window)
+
+
+# hexagons sized for the map zoom, see dash_views.hex_table
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def hex_data(county, years, year_built, geography_included, sub_geo, zoom, filter_version):
+    rerun.computed('hex_data')
+    return dash_views.hex_table(sales_store.select([county], years), years, year_built,
+                                geography_included, sub_geo, zoom)
+
+
+# tract polygons at every level of detail, reprojected, simplified &
+# quantized once per process
+@st.cache_resource(max_entries=RESOURCE_CACHE_ENTRIES)
+def load_tract_lods(county):
+    rerun.computed('load_tract_lods')
+    return tract_geometry.load_tract_lods(tract_geometry.COUNTY_TRACTS[county])
+
+
+# the browser only gets the detail visible at the map's zoom. streamlit
+# doesn't report zooming back, so this is picked for the opening view
+@st.cache_resource(max_entries=RESOURCE_CACHE_ENTRIES)
+def load_tract_view(county):
+    rerun.computed('load_tract_view')
+    shapes = tract_geometry.shapes_for_zoom(load_tract_lods(county), dash_views.MAP_ZOOM)
+    return shapes, tract_geometry.view_center(shapes)
+
+
+# color class edges for the county, shared by both layers & every filter
+@st.cache_resource(max_entries=RESOURCE_CACHE_ENTRIES, show_spinner=False)
+def load_price_breaks(county, county_version):
+    rerun.computed('load_price_breaks')
+    return map_layers.price_breaks(sales_store.select([county]))
+
+
+# colors, counts & tooltip strings of the map for one filter state. the view
+# and base map aren't part of the key, so toggling them only rebuilds the deck.
+# keyed by the breaks themselves rather than the county's version, so data
+# changes elsewhere in the county that leave the breaks alone keep it cached
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES, show_spinner=False)
+def map_table(county, years, year_built, geography_included, sub_geo, layer,
+              filter_version, breaks_version):
+    rerun.computed('map_table')
+    breaks = load_price_breaks(county, sales_store.version_of([county]))
+    if layer == 'Sales density':
+        hex_df = hex_data(county, years, year_built, geography_included, sub_geo,
+                          dash_views.MAP_ZOOM, filter_version)
+        return map_layers.layer_table(hex_df, breaks)
+    grouped_df, _ = filter_data(county, years, year_built, geography_included,
+                                sub_geo, filter_version)
+    return map_layers.layer_table(grouped_df, breaks)
 
 
 # define columns
@@ -518,19 +377,75 @@ col1, col2, col3 = st.columns([
 ])
 
 
-if map_view == '2D':
-    col1.pydeck_chart(mapper_2D(), use_container_width=True)
-else:
-    col1.pydeck_chart(mapper_3D(), use_container_width=True)
+def cached_result(kind, state, version, build, rows):
+    # a rendered result from the shared disk cache, or build() it and store
+    # it there. a hit does no data work at all. timed as stage `kind`, with
+    # rows(value) as its row count
+    with rerun.stage(kind) as stage:
+        if results is None:
+            value = build()
+        else:
+            value = results.get(kind, state, version)
+            if value is None:
+                value = build()
+                results.put(kind, state, value, version)
+            else:
+                stage['cache'] = 'disk'
+        stage['rows'] = rows(value)
+    return value
+
+
+# the sidebar state each result depends on, and the version of its data
+filter_state = dash_views.filter_state(county, years, year_built, geography_included,
+                                       sub_geo, KPI_ENGINE)
+with rerun.stage('versions'):
+    versions = dash_views.data_versions(sales_store, county, years, geography_included,
+                                        sub_geo)
+    breaks_version = dash_views.breaks_version(
+        load_price_breaks(county, sales_store.version_of([county])))
+map_version = f"{versions['filter']}.{breaks_version}"
+
+
+def build_kpi():
+    return filter_data(county, years, year_built, geography_included,
+                       tuple(sub_geo), versions['filter'])[1]
+
+
+def build_map():
+    map_df = map_table(county, years, year_built, geography_included, tuple(sub_geo),
+                       map_layer, versions['filter'], breaks_version)
+    deck = dash_views.mapper(map_df, map_layer, map_view, base_map, *load_tract_view(county))
+    return dash_views.map_result(map_df, deck)
+
+
+kpi = cached_result('kpi', filter_state, versions['filter'], build_kpi,
+                    lambda kpi: kpi['total_sales'])
+map_result = cached_result(
+    'map', dash_views.map_state(filter_state, map_layer, map_view, base_map), map_version,
+    build_map, lambda result: result['located'])
+with rerun.stage('render_map', cached=False):
+    col1.pydeck_chart(result_cache.CachedDeck(**map_result['deck']), use_container_width=True)
+if map_layer == 'Sales density' and map_result['located'] < kpi['total_sales']:
+    col1.caption(f"{map_result['located']:,} of {kpi['total_sales']:,} selected sales have coordinates and are shown.")
 
 # kpi values
-total_sales = '{:,.0f}'.format(filter_data()[1]['unique_ID'].sum())
-median_price_SF = '${:.0f}'.format(filter_data()[2]['price_sf'].median())
-median_price = '${:,.0f}'.format(filter_data()[2]['Sale Price'].median())
-med_vintage = '{:.0f}'.format(filter_data()[2]['year_blt'].median())
-med_SF = '{:,.0f}'.format(filter_data()[2]['Square Ft'].median())
-YoY_delta = '{0:.1%}'.format((filter_data()[4]['price_sf'].median(
-) - filter_data()[3]['price_sf'].median()) / filter_data()[3]['price_sf'].median())
+total_sales = '{:,.0f}'.format(kpi['total_sales'])
+median_price_SF = '${:.0f}'.format(kpi['price_sf'])
+median_price = '${:,.0f}'.format(kpi['Sale Price'])
+med_vintage = '{:.0f}'.format(kpi['year_blt'])
+med_SF = '{:,.0f}'.format(kpi['Square Ft'])
+if kpi['yoy_delta'] is not None:
+    YoY_delta = '{0:.1%}'.format(kpi['yoy_delta'])
+
+# interquartile ranges shown under the medians
+iqr_price = '${:,.0f} - ${:,.0f}'.format(*kpi['iqr']['Sale Price'])
+iqr_vintage = '{:.0f} - {:.0f}'.format(*kpi['iqr']['year_blt'])
+iqr_SF = '{:,.0f} - {:,.0f}'.format(*kpi['iqr']['Square Ft'])
+
+# flag approximate values when the sketch engine is on
+if KPI_ENGINE == 'sketch':
+    median_price_SF, median_price, med_vintage, med_SF = [
+        '~' + v for v in (median_price_SF, median_price, med_vintage, med_SF)]
 
 # kpi styles
 KPI_label_font_size = '15'
@@ -543,6 +458,8 @@ KPI_value_font_weight = '800'  # thickness of the bold
 
 KPI_line_height = '25'  # vertical spacing between the KPI label and value
 
+KPI_iqr_font_size = '12'  # p25 - p75 line under the medians
+
 
 # KPI tyme
 with col3:
@@ -552,13 +469,13 @@ with col3:
     subcol1.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Total home sales</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{total_sales}</span>", unsafe_allow_html=True)
 
     # second metric - "Median price"
-    subcol2.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median sale price</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{median_price}</span>", unsafe_allow_html=True)
+    subcol2.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median sale price</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{median_price}</span><br><span style='color:{KPI_label_font_color}; font-size:{KPI_iqr_font_size}px'>p25-p75: {iqr_price}</span>", unsafe_allow_html=True)
 
     # third metric - "Median vintage"
-    subcol3.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median vintage</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{med_vintage}</span>", unsafe_allow_html=True)
+    subcol3.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median vintage</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{med_vintage}</span><br><span style='color:{KPI_label_font_color}; font-size:{KPI_iqr_font_size}px'>p25-p75: {iqr_vintage}</span>", unsafe_allow_html=True)
 
     # fourth metric - "Median SF"
-    subcol4.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median size (SF)</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{med_SF}</span>", unsafe_allow_html=True)
+    subcol4.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>Median size (SF)</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{med_SF}</span><br><span style='color:{KPI_label_font_color}; font-size:{KPI_iqr_font_size}px'>p25-p75: {iqr_SF}</span>", unsafe_allow_html=True)
 
     # delta KPI, resting under the 4 KPIs above
     if years[0] != years[1]:
@@ -569,9 +486,73 @@ with col3:
             f"<span style='color:{KPI_label_font_color}; font-size: 17px; font-weight:{KPI_label_font_weight}; display: flex; justify-content: center;'>No year over year change.</span>", unsafe_allow_html=True)
 
 
+# one KPI column per region in comparison mode
+def build_compare_kpi():
+    return compare_data(county, years, year_built, tuple(sub_geo), versions['filter'])
+
+
+if compare_regions:
+    region_kpis = cached_result('compare_kpi', filter_state, versions['filter'],
+                                build_compare_kpi,
+                                lambda kpis: sum(k['total_sales'] for k in kpis))
+    with col3:
+        for subcol, region, region_kpi in zip(st.columns(len(sub_geo)), sub_geo, region_kpis):
+            region_price_SF = '${:.0f}'.format(region_kpi['price_sf'])
+            region_price = '${:,.0f}'.format(region_kpi['Sale Price'])
+            if KPI_ENGINE == 'sketch':
+                region_price_SF, region_price = '~' + region_price_SF, '~' + region_price
+            region_delta = ''
+            if region_kpi['yoy_delta'] is not None:
+                region_delta = "<br><span style='color:{}; font-size:{}px'>{} to {}: {:.1%}</span>".format(
+                    KPI_label_font_color, KPI_iqr_font_size, years[0], years[1], region_kpi['yoy_delta'])
+            subcol.markdown(f"<span style='color:{KPI_label_font_color}; font-size:{KPI_label_font_size}px; font-weight:{KPI_label_font_weight}'>{region}</span><br><span style='color:{KPI_value_font_color}; font-size:{KPI_value_font_size}px; font-weight:{KPI_value_font_weight}; line-height: {KPI_line_height}px'>{region_price_SF}</span><span style='color:{KPI_label_font_color}; font-size:{KPI_iqr_font_size}px'> / SF</span><br><span style='color:{KPI_label_font_color}; font-size:{KPI_iqr_font_size}px'>{region_kpi['total_sales']:,} sales, median {region_price}</span>{region_delta}", unsafe_allow_html=True)
+
+
 # draw the plotly line chart
-col3.plotly_chart(charter(), use_container_width=True, config={
-                  'displayModeBar': False}, help='test')
+window = dash_views.TREND_WINDOWS[trend_window]
+
+
+def build_chart():
+    chart_df = trend_data(county, year_built, geography_included,
+                          tuple(sub_geo), 1, versions['trend'])
+    trend_df = None
+    if window > 1:
+        trend_df = trend_data(county, year_built, geography_included,
+                              tuple(sub_geo), window, versions['trend'])
+    return dash_views.chart_result(
+        dash_views.charter(chart_df, years, sub_geo, trend_df, window))
+
+
+def build_compare_chart():
+    compare_df = compare_trend_data(county, year_built, tuple(sub_geo), window,
+                                    versions['trend'])
+    return dash_views.chart_result(dash_views.compare_charter(compare_df, years, window))
+
+
+def chart_points(fig):
+    # points over every line of a chart. a figure without traces (no
+    # region selected) counts 0 here and is not rendered, see below
+    return sum(len(trace.get('x', [])) for trace in fig['data'])
+
+
+if compare_regions:
+    chart = cached_result('compare_chart', dash_views.chart_state(filter_state, window),
+                          versions['trend'], build_compare_chart,
+                          chart_points)
+else:
+    chart = cached_result('chart', dash_views.chart_state(filter_state, window),
+                          versions['trend'], build_chart,
+                          chart_points)
+with rerun.stage('render_chart', cached=False) as stage:
+    # rendered points, 0 when only the caption below is drawn
+    stage['rows'] = chart_points(chart)
+    # st.plotly_chart refuses a figure dict without traces, which is what a
+    # Sub-geography filter with every region cleared draws
+    if chart['data']:
+        col3.plotly_chart(chart, use_container_width=True, config={
+                          'displayModeBar': False}, help='test')
+    else:
+        col3.caption('Select one or more regions to see the price / SF trend.')
 
 # Draw ARC logo at the bottom of the page
 im = Image.open('content/logo.png')
@@ -585,9 +566,26 @@ with col3:
 if map_view == '2D':
     with col1:
         expander = st.expander("Notes")
-        expander.markdown("<span style='color:#022B3A'> Darker shades of Census tracts represent higher sales prices per SF for the selected time period. Dashboard excludes non-qualified, non-market, and bulk transactions. Excludes transactions below $1,000 and homes smaller than 75 square feet. Data downloaded from Forsyth County public records on May 11, 2023.</span>", unsafe_allow_html=True)
+        expander.markdown(f"<span style='color:#022B3A'> Darker shades of Census tracts represent higher sales prices per SF for the selected time period. Dashboard excludes non-qualified, non-market, and bulk transactions. Excludes transactions below $1,000 and homes smaller than 75 square feet. Data downloaded from {county} County public records on May 11, 2023.</span>", unsafe_allow_html=True)
 else:
     with col1:
         col1.markdown("<span style='color:#022B3A'><b>Shift + click</b> in 3D view to rotate and change map angle. Census tract 'height' represents total sales.</span>", unsafe_allow_html=True)
         expander = st.expander("Notes")
-        expander.markdown("<span style='color:#022B3A'>Census tract 'height' representative of total sales per tract. Darker shades of Census tracts represent higher sales prices per SF for the selected time period. Dashboard excludes non-qualified, non-market, and bulk transactions. Excludes transactions below $1,000 and homes smaller than 75 square feet. Data downloaded from Forsyth County public records on May 11, 2023.</span>", unsafe_allow_html=True)
+        expander.markdown(f"<span style='color:#022B3A'>Census tract 'height' representative of total sales per tract. Darker shades of Census tracts represent higher sales prices per SF for the selected time period. Dashboard excludes non-qualified, non-market, and bulk transactions. Excludes transactions below $1,000 and homes smaller than 75 square feet. Data downloaded from {county} County public records on May 11, 2023.</span>", unsafe_allow_html=True)
+
+
+# record this rerun. the diagnostics panel is hidden unless the url has
+# ?diagnostics=1 or DIAGNOSTICS=1 is set
+stage_metrics_store = load_stage_metrics()
+stage_metrics_store.add(rerun)
+if (st.experimental_get_query_params().get('diagnostics') == ['1'] or
+        os.environ.get('DIAGNOSTICS') == '1'):
+    with st.sidebar.expander('Diagnostics', expanded=True):
+        st.caption('This rerun')
+        st.dataframe(pd.DataFrame(rerun.stages).assign(
+            computed=lambda df: df['computed'].str.join(', ')), use_container_width=True)
+        st.caption('Reruns of every session in this process')
+        st.dataframe(pd.DataFrame(stage_metrics_store.summary()).round(1),
+                     use_container_width=True)
+        st.download_button('Download metrics (JSON)', stage_metrics_store.to_json(),
+                           file_name='stage_metrics.json', mime='application/json')
@@ -0,0 +1,214 @@
+import argparse
+import fcntl
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import dash_views
+import map_layers
+import result_cache
+import sales_cube
+import sales_data
+import tract_geometry
+
+# renders the dashboard's results for the common sidebar states into the
+# shared result cache (result_cache.py), so the first visitors after a deploy
+# or an ingest are served from it instead of paying the cold data work.
+# ingest.py starts it in the background after a batch lands, and v2_dash.py
+# when it sees a dataset version nothing has warmed yet; one run at a time
+# per cache file
+#
+#   python warmup.py [--workers 4]
+#
+# every sale-year range x vintage range x region (the entire county or one
+# sub-geography) gets its KPIs, trend chart and default 2D tract map. the
+# default state also gets every map layer, view, base map & rolling window.
+# results are keyed by the version of the data they cover, so after an
+# ingest only the states over changed sale years & tracts are rendered
+
+KPI_ENGINE = os.environ.get('KPI_ENGINE', 'exact')
+
+# where the dashboard sends the warm-up's report
+WARMUP_LOG = 'warmup.log'
+
+
+# per worker process: the store and what's built from it, once each
+
+
+@lru_cache(maxsize=1)
+def load_store():
+    return sales_data.SalesStore()
+
+
+# one cube per county over all its sale years, as the dashboard keeps it
+@lru_cache(maxsize=1)
+def load_sales_cube(county, engine):
+    return sales_cube.SalesCube(load_store().select([county]), engine=engine)
+
+
+@lru_cache(maxsize=8)
+def load_monthly_series(county):
+    return sales_cube.MonthlySeries(load_store().select([county]))
+
+
+@lru_cache(maxsize=8)
+def load_price_breaks(county):
+    return map_layers.price_breaks(load_store().select([county]))
+
+
+@lru_cache(maxsize=8)
+def load_tract_view(county):
+    levels = tract_geometry.load_tract_lods(tract_geometry.COUNTY_TRACTS[county])
+    shapes = tract_geometry.shapes_for_zoom(levels, dash_views.MAP_ZOOM)
+    return shapes, tract_geometry.view_center(shapes)
+
+
+def filter_states(store, county):
+    # (year_built, geography_included, sub_geo) of every warmed filter, per
+    # sale-year range
+    filters = [(year_built, 'Entire county', '')
+               for year_built in dash_views.slider_ranges(dash_views.YEAR_BUILT_OPTIONS)]
+    filters += [(year_built, 'Sub-geography', [region])
+                for year_built in dash_views.slider_ranges(dash_views.YEAR_BUILT_OPTIONS)
+                for region in sales_data.sub_geos(county)]
+    return {years: filters for years in dash_views.slider_ranges(store.years(county))}
+
+
+def is_default(years, year_built, geography_included, store, county):
+    return (years == dash_views.default_years(store.years(county)) and
+            year_built == dash_views.DEFAULT_YEAR_BUILT and
+            geography_included == 'Entire county')
+
+
+def warm(cache_path, county, years, filters, engine=KPI_ENGINE):
+    # one sale-year range of one county: every filter's results not already
+    # cached are rendered, from a cube built the first time one is needed.
+    # returns the results written & this worker's peak RSS in KB
+    store = load_store()
+    results = result_cache.ResultCache(cache_path)
+    breaks_version = dash_views.breaks_version(load_price_breaks(county))
+    written = 0
+
+    for year_built, geography_included, sub_geo in filters:
+        state = dash_views.filter_state(county, years, year_built, geography_included,
+                                        sub_geo, engine)
+        versions = dash_views.data_versions(store, county, years, geography_included, sub_geo)
+        map_version = f"{versions['filter']}.{breaks_version}"
+        everything = is_default(years, year_built, geography_included, store, county)
+        layers = dash_views.MAP_LAYERS if everything else dash_views.MAP_LAYERS[:1]
+        views = dash_views.MAP_VIEWS if everything else dash_views.MAP_VIEWS[:1]
+        base_maps = list(dash_views.BASE_MAPS) if everything else [dash_views.DEFAULT_BASE_MAP]
+        windows = list(dash_views.TREND_WINDOWS.values()) if everything else [1]
+
+        grouped_df, kpi = None, None
+        if results.get('kpi', state, versions['filter']) is None:
+            grouped_df, kpi = dash_views.filter_cube(load_sales_cube(county, engine),
+                                                     years, year_built,
+                                                     geography_included, sub_geo)
+            results.put('kpi', state, kpi, versions['filter'])
+            written += 1
+
+        for layer in layers:
+            table = None
+            for view in views:
+                for base_map in base_maps:
+                    key = dash_views.map_state(state, layer, view, base_map)
+                    if results.get('map', key, map_version) is not None:
+                        continue
+                    if table is None:
+                        table = map_table(store, load_sales_cube(county, engine),
+                                          county, years, year_built,
+                                          geography_included, sub_geo, layer, grouped_df)
+                    deck = dash_views.mapper(table, layer, view, base_map,
+                                             *load_tract_view(county))
+                    results.put('map', key, dash_views.map_result(table, deck), map_version)
+                    written += 1
+
+        regions = dash_views.regions(geography_included, sub_geo)
+        for window in windows:
+            key = dash_views.chart_state(state, window)
+            if results.get('chart', key, versions['trend']) is not None:
+                continue
+            series = load_monthly_series(county)
+            chart_df = series.series(year_built, regions, 1)
+            trend_df = series.series(year_built, regions, window) if window > 1 else None
+            fig = dash_views.charter(chart_df, years, sub_geo, trend_df, window)
+            results.put('chart', key, dash_views.chart_result(fig), versions['trend'])
+            written += 1
+
+    results.close()
+    return written, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def map_table(store, cube, county, years, year_built, geography_included, sub_geo,
+              layer, grouped_df=None):
+    breaks = load_price_breaks(county)
+    if layer == 'Sales density':
+        hex_df = dash_views.hex_table(store.select([county], years), years, year_built,
+                                      geography_included, sub_geo)
+        return map_layers.layer_table(hex_df, breaks)
+    if grouped_df is None:
+        grouped_df, _ = dash_views.filter_cube(cube, years, year_built,
+                                               geography_included, sub_geo)
+    return map_layers.layer_table(grouped_df, breaks)
+
+
+def warmup(cache_path=result_cache.RESULT_CACHE, workers=os.cpu_count()):
+    # fills the cache from a process pool, one task per (county, sale-year
+    # range), and prints the time, results written, worker memory & cache size
+    with open(cache_path + '.warmup.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print('warm-up already running for', cache_path)
+            return
+
+        start = time.perf_counter()
+        store = sales_data.SalesStore()
+        results = result_cache.ResultCache(cache_path)
+        before = results.stats()
+
+        tasks = [(county, years, filters) for county in store.counties
+                 for years, filters in filter_states(store, county).items()]
+        # the default states first, so they're ready soonest
+        tasks.sort(key=lambda t: t[1] != dash_views.default_years(store.years(t[0])))
+        with ProcessPoolExecutor(workers) as pool:
+            done = list(pool.map(warm, *zip(*[(cache_path,) + t for t in tasks])))
+
+        after = results.stats()
+        written = sum(w for w, _ in done)
+        peak_kb = [rss for _, rss in done]
+        print(f'warm-up: {written:,} results for {sum(len(t[2]) for t in tasks):,} filter '
+              f'states in {time.perf_counter() - start:.1f} s with {workers} workers; '
+              f'worker peak RSS up to {max(peak_kb, default=0) / 1024:.0f} MB; cache '
+              f'{before["bytes"] / 2 ** 20:.1f} -> {after["bytes"] / 2 ** 20:.1f} MB '
+              f'({after["entries"]:,} results)', flush=True)
+
+
+def start(cache_path=result_cache.RESULT_CACHE, log_path=WARMUP_LOG):
+    # `python warmup.py` in the background, its report appended to `log_path`.
+    # returns the process, which the caller polls so it's reaped once done, or
+    # None when the result cache is off or WARMUP=0. it gets its own session,
+    # so a Ctrl-C in the terminal that started it doesn't cut it short
+    if not cache_path or os.environ.get('WARMUP', '1') == '0':
+        return None
+    with open(log_path, 'a') as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--cache', cache_path],
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--cache', default=result_cache.RESULT_CACHE)
+    args = parser.parse_args()
+    warmup(args.cache, args.workers)
+
+
+if __name__ == '__main__':
+    main()